@@ -0,0 +1,75 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+# Benchmarks the indicators module against the equivalent pandas code, and checks that both agree.
+# Usage: python bench_indicators.py [number of candles]
+# pandas is only needed to run this file, not to run the bot.
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import indicators
+
+
+def pandas_rsi(prices, period):
+    delta = prices.diff()[1:]
+    up = delta.clip(lower=0).ewm(span=period).mean()
+    down = (-delta.clip(upper=0)).ewm(span=period).mean()
+    return 100.0 - 100.0/(1.0 + up/down)
+
+def pandas_macd(prices, fast=12, slow=26, signal=9):
+    line = prices.ewm(span=fast, adjust=False).mean() - prices.ewm(span=slow, adjust=False).mean()
+    signal_line = line.ewm(span=signal, adjust=False).mean()
+    return line, signal_line, line - signal_line
+
+def pandas_atr(high, low, close, period=14):
+    prev_close = close.shift(1).fillna(close)
+    tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    return tr.ewm(alpha=1/period, adjust=False).mean()
+
+def pandas_bollinger(prices, period=20, num_std=2.0):
+    middle = prices.rolling(period).mean()
+    std = prices.rolling(period).std(ddof=0)
+    return middle, middle + num_std*std, middle - num_std*std
+
+
+def bench(name, np_func, pd_func, number):
+    t_np = min(timeit.repeat(np_func, number=number, repeat=5)) / number
+    t_pd = min(timeit.repeat(pd_func, number=number, repeat=5)) / number
+    diff = np.nanmax(np.abs(np.asarray(np_func(), dtype=float) - np.asarray(pd_func(), dtype=float)))
+    print(f"{name:<24}{t_np*1e6:>12.1f}{t_pd*1e6:>12.1f}{t_pd/t_np:>10.1f}x{diff:>12.2e}")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = np.random.default_rng(0)
+    close = 100*np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    high = close*(1 + rng.uniform(0, 0.01, n))
+    low = close*(1 - rng.uniform(0, 0.01, n))
+    s_close, s_high, s_low = pd.Series(close), pd.Series(high), pd.Series(low)
+    number = 20
+
+    print(f"{n} candles. Times are per call.")
+    print(f"{'indicator':<24}{'numpy us':>12}{'pandas us':>12}{'speedup':>11}{'max diff':>12}")
+    bench('sma', lambda: indicators.sma(close, 50), lambda: s_close.rolling(50).mean(), number)
+    bench('sma_last', lambda: indicators.sma_last(close, 50), lambda: s_close.rolling(50).mean().iloc[-1], number)
+    bench('ema', lambda: indicators.ema(close, 50), lambda: s_close.ewm(span=50, adjust=False).mean(), number)
+    bench('ema_last', lambda: indicators.ema_last(close, 50), lambda: s_close.ewm(span=50, adjust=False).mean().iloc[-1], number)
+    bench('rsi', lambda: indicators.rsi(close, 14), lambda: pandas_rsi(s_close, 14), number)
+    bench('rsi_last', lambda: indicators.rsi_last(close, 14), lambda: pandas_rsi(s_close, 14).iloc[-1], number)
+    bench('macd', lambda: indicators.macd(close), lambda: pandas_macd(s_close), number)
+    bench('macd_last', lambda: indicators.macd_last(close), lambda: [s.iloc[-1] for s in pandas_macd(s_close)], number)
+    bench('atr', lambda: indicators.atr(high, low, close), lambda: pandas_atr(s_high, s_low, s_close), number)
+    bench('atr_last', lambda: indicators.atr_last(high, low, close), lambda: pandas_atr(s_high, s_low, s_close).iloc[-1], number)
+    bench('bollinger', lambda: indicators.bollinger(close), lambda: pandas_bollinger(s_close), number)
+    bench('bollinger_last', lambda: indicators.bollinger_last(close), lambda: [s.iloc[-1] for s in pandas_bollinger(s_close)], number)
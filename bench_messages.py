@@ -0,0 +1,92 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+# Benchmarks decoding and dispatching websocket messages: json against orjson (if installed), and routing by topic
+# in KucoinWebsocket against the single callback that checked the subject of every message.
+# Usage: python bench_messages.py [number of markets]
+
+import asyncio
+import json
+import sys
+import timeit
+
+import wsclient
+
+
+def ticker(symbol, i):
+    return json.dumps({'type': 'message', 'topic': f'/market/ticker:{symbol}', 'subject': 'trade.ticker',
+                       'data': {'sequence': str(1600000000000 + i), 'price': '39123.4', 'size': '0.0012',
+                                'bestAsk': '39123.5', 'bestAskSize': '0.51', 'bestBid': '39123.4', 'bestBidSize': '1.2',
+                                'time': 1600000000000 + i}})
+
+def fill(i):
+    return json.dumps({'type': 'message', 'topic': '/spotMarket/tradeOrders', 'subject': 'orderChange', 'channelType': 'private',
+                       'data': {'symbol': 'BTC-USDT', 'orderType': 'market', 'side': 'buy', 'orderId': str(i), 'type': 'match',
+                                'orderTime': 1600000000000000000, 'size': '0.01', 'filledSize': '0.01', 'price': '0',
+                                'matchPrice': '39123.5', 'matchSize': '0.01', 'tradeId': str(i), 'remainSize': '0',
+                                'status': 'match', 'ts': 1600000000000000000}})
+
+
+def on_ticker(symbol, msg):
+    data = msg['data']
+    return float(data['price']), float(data['bestBid']), float(data['bestAsk'])
+
+def on_order_change(msg):
+    return msg['data']['type'] == 'match'
+
+async def old_handle_evt(msg):
+    """ The callback every message used to go through. """
+    if msg['subject'] == 'trade.ticker':
+        on_ticker(msg['topic'].split(':')[-1], msg)
+        return
+    try:
+        assert(msg['topic'] == '/spotMarket/tradeOrders')
+        assert(msg['data']['type'] == 'match')
+    except (KeyError, AssertionError):
+        pass
+    if msg['subject'] == 'account.balance':
+        pass
+
+def bench(name, func, messages, number):
+    t = min(timeit.repeat(lambda: func(messages), number=number, repeat=5)) / number / len(messages)
+    print(f"{name:<32}{t*1e6:>10.2f}")
+    return t
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    symbols = [f'C{i}-USDT' for i in range(n)]
+    # Mostly tickers, with the odd fill, like a live session
+    messages = [ticker(symbols[i % n], i) for i in range(1000)] + [fill(i) for i in range(10)]
+    number = 20
+
+    websocket = wsclient.KucoinWebsocket(None)
+    for sym in symbols:
+        websocket.handlers[f'/market/ticker:{sym}'] = lambda msg, sym=sym: on_ticker(sym, msg)
+    websocket.handlers['/spotMarket/tradeOrders'] = on_order_change
+
+    def old_path(messages):
+        loop = asyncio.new_event_loop()
+        async def run():
+            for raw in messages:
+                await old_handle_evt(json.loads(raw))
+        loop.run_until_complete(run())
+        loop.close()
+    def new_path(messages):
+        for raw in messages:
+            websocket.dispatch(raw)
+
+    print(f"{len(messages)} messages on {n} markets. Decoder: {wsclient.loads.__module__}. Times are per message.")
+    print(f"{'':<32}{'us':>10}")
+    bench('decode with json', lambda m: [json.loads(raw) for raw in m], messages, number)
+    bench('decode with wsclient.loads', lambda m: [wsclient.loads(raw) for raw in m], messages, number)
+    old = bench('json + handle_evt', old_path, messages, number)
+    new = bench('KucoinWebsocket.dispatch', new_path, messages, number)
+    print(f"Dispatch is {old/new:.1f}x faster.")
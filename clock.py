@@ -0,0 +1,65 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+
+class Clock:
+    """ The real clock. Anything that reads the time or sleeps can be handed a different clock to run on virtual time. """
+    def time(self) -> float:
+        return time.time()
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+class VirtualClock(Clock):
+    """ A clock that only moves when it is advanced.
+    Coroutines sleeping on it wake up as soon as the clock is advanced past their wake up time. """
+    def __init__(self, start: float = 0):
+        self.now = start
+        # heap of (wake up time, sequence number, future)
+        self.sleepers = []
+        self._sequence = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        # Sleeps shorter than the float resolution of the timestamp would otherwise wake without time moving on,
+        # so a caller waiting for time to pass (like a token bucket refilling) would never see it pass
+        wake_time = max(self.now + seconds, math.nextafter(self.now, math.inf))
+        heapq.heappush(self.sleepers, (wake_time, next(self._sequence), future))
+        await future
+
+    def next_wake_time(self):
+        """ Returns the earliest time a sleeper is waiting for, or None if nothing is sleeping. """
+        while len(self.sleepers) > 0 and self.sleepers[0][2].done():
+            # Drop sleepers that were cancelled
+            heapq.heappop(self.sleepers)
+        if len(self.sleepers) == 0:
+            return None
+        return self.sleepers[0][0]
+    def advance_to(self, t: float):
+        """ Moves the clock forward to t and wakes every sleeper that is due. """
+        self.now = max(self.now, t)
+        while len(self.sleepers) > 0 and self.sleepers[0][0] <= self.now:
+            _, _, future = heapq.heappop(self.sleepers)
+            if not future.done():
+                future.set_result(None)
+
+# Shared by everything that is not given a clock of its own
+SYSTEM_CLOCK = Clock()
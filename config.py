@@ -52,11 +52,83 @@ else:
         if s.split('-')[1] == 'USDT':
             syms.append(s)
     SYMBOLS = syms
+
+# Further KuCoin accounts to trade at the same time as the one above. They all share the market data and signals, so
+# each account only adds its own private connection. An account is a dict with a 'name', its 'api_key', 'api_secret'
+# and 'api_passphrase', and optionally its own 'transact_amount', 'sell_to_buy_ratio' and 'take_profit_percent'
+# (a single value for every market, or a dict by symbol). For example:
+# ACCOUNTS = [
+#     {'name': 'savings', 'api_key': "...", 'api_secret': "...", 'api_passphrase': "...", 'transact_amount': 20},
+# ]
+# Use the command "account savings" to have the console commands act on that account.
+ACCOUNTS = []
 ### General settings
 
 # Time in seconds to sleep between refreshing the display
 MAIN_LOOP_SLEEP_TIME = 12
 
+# The log files are started over once they reach this size in bytes. The last LOG_BACKUP_COUNT of them are kept
+# (as trades.log.1, trades.log.2, ...).
+LOG_MAX_BYTES = 10*1024*1024
+LOG_BACKUP_COUNT = 5
+
+# Candles are downloaded shortly after they close: REFRESH_SETTLE_DELAY seconds after, plus a random delay of up to
+# REFRESH_JITTER seconds so that the markets are spread out. All downloads together make at most
+# REST_REQUESTS_PER_SECOND requests per second.
+REST_REQUESTS_PER_SECOND = 5
+REFRESH_SETTLE_DELAY = 2
+REFRESH_JITTER = 3
+
+# Set FAST_ORDERS to True to send orders and cancels over a connection that is kept open, signed with keys prepared in
+# advance and timestamped with the server's clock, which is measured every ORDER_CLOCK_SYNC_INTERVAL seconds (this also
+# keeps the connection open). The program carries on while these requests are out, and they time out after
+# ORDER_TIMEOUT seconds. The command "latency" shows how long recent requests took. This hasn't been proven against the
+# live API yet, so by default orders go through the kucoin library, which holds up the program until KuCoin replies.
+FAST_ORDERS = False
+ORDER_CLOCK_SYNC_INTERVAL = 30
+ORDER_TIMEOUT = 10
+
+# Every fill is added to a ledger of positions, in lots sold first in, first out, which gives the average cost and the
+# realized and unrealized profit of each market. It is saved to LEDGER_FILE ({account} is replaced by the account name)
+# after every fill, and loaded again on start up. Delete the file to start over.
+LEDGER_FILE = 'ledger-{account}.json'
+
+# Set true to record every websocket message and REST response to RECORDING_FILE.
+# A recording can be played back offline with: python replay.py session.rec.gz
+# Note that recordings contain your balances and orders, so keep them private.
+# Only the main account is recorded: replay.py plays a session back as a single account, so the orders and balances
+# of the other ACCOUNTS are left out of the recording (the market data they share is in it).
+RECORD_SESSION = False
+RECORDING_FILE = 'session.rec.gz'
+
+# Time in seconds between checks for changes to this file. Changes are applied without restarting, except for
+# the settings only read at start up: SANDBOX (and with it the choice of SYMBOLS), the credentials, ACCOUNTS (their
+# strategy settings do apply), RECORD_SESSION, RECORDING_FILE, PAPER_TRADING, PAPER_STARTING_FUNDS, PAPER_FEE_RATE,
+# LEDGER_FILE, FAST_ORDERS, ORDER_TIMEOUT, ORDER_CLOCK_SYNC_INTERVAL, HEADLESS, CONTROL_API_PORT, CONTROL_API_SOCKET,
+# CONTROL_API_TOKEN, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOOP_STALL_THRESHOLD, REST_REQUESTS_PER_SECOND,
+# REFRESH_SETTLE_DELAY and REFRESH_JITTER. Set to 0 to disable.
+CONFIG_RELOAD_INTERVAL = 5
+
+# Set true to run without the console display and input, e.g. on a server.
+HEADLESS = False
+# The control API accepts the console commands and serves the state of the bot as JSON, for example:
+#   curl -H "Authorization: Bearer your-token-here" http://127.0.0.1:8765/state
+#   curl -H "Authorization: Bearer your-token-here" -d "buy BTC-USDT $5" http://127.0.0.1:8765/command
+# Set CONTROL_API_PORT to serve it on that port of this machine only, or CONTROL_API_SOCKET to a file path
+# to serve it on a Unix socket instead (not available on Windows). Leave both as None to disable it.
+# Requests must give CONTROL_API_TOKEN, which anyone who has it can use to trade: make it long and random, e.g. the
+# output of: python -c "import secrets; print(secrets.token_urlsafe())". Requests from web pages are always refused.
+CONTROL_API_PORT = None
+CONTROL_API_SOCKET = None
+CONTROL_API_TOKEN = None
+
+# Report (on screen and in detailed_info.log, with a stack trace) whenever something holds up the program
+# for longer than this many seconds. Set to 0 to disable.
+LOOP_STALL_THRESHOLD = 0.5
+# The command "profile 30" samples what the program is doing for 30 seconds, and writes the results to this folder.
+PROFILE_DIR = '.'
+PROFILE_SAMPLE_INTERVAL = 0.005
+
 ### Strategy related settings
 
 ## 
@@ -64,6 +136,16 @@ MAIN_LOOP_SLEEP_TIME = 12
 WHICH_MA = 'EMA' 
 assert(WHICH_MA in ['SMA', 'EMA'])
 
+# Set true to act on crossovers before their candle closes. Every ticker then updates the candle that is still
+# forming, and the moving averages it would give if it closed at that price. A crossover they show is acted on once it
+# has held for LIVE_CONFIRM_TICKS tickers in a row and for LIVE_CONFIRM_SECONDS seconds, with the fast and slow
+# averages at least LIVE_CONFIRM_SEPARATION percent of the price apart; it isn't acted on again when the candle
+# closes. The price may still turn back before the close, so stricter rules mean fewer false signals but later ones.
+LIVE_CANDLES = False
+LIVE_CONFIRM_TICKS = 3
+LIVE_CONFIRM_SECONDS = 10
+LIVE_CONFIRM_SEPARATION = 0.05
+
 allowed_candle_windows = ['1min', '3min', '5min', '15min', '30min', '1hour', '2hour', '4hour', '6hour', '8hour', '12hour', '1day', '1week']
 ## Defaults
 default_fast_ma_period = 20
@@ -92,7 +174,32 @@ MA_WINDOW['BTC-USDT'] = '15min'
 TRANSACT_AMOUNT['BTC-USDT'] = 10
 SELL_TO_BUY_RATIO['BTC-USDT'] = 1
 
+### Paper trading
+# Set true to trade with simulated money instead of placing orders on KuCoin (no API key is needed).
+# Every strategy in PAPER_STRATEGIES then trades its own simulated account of PAPER_STARTING_FUNDS USDT, all driven by the
+# same live prices and candles, so many variants can be compared side by side without any extra downloads.
+# A strategy is a dict with a 'name', and any of the settings below to change from the ones above:
+#   'fast_ma_period', 'slow_ma_period', 'which_ma', 'transact_amount', 'sell_to_buy_ratio', 'take_profit_percent'
+# A setting may be a single value for every market, or a dict by symbol. The candle window (MA_WINDOW) is shared.
+PAPER_TRADING = False
+PAPER_STARTING_FUNDS = 1000
+# Fraction of the value of each simulated fill paid as a trading fee
+PAPER_FEE_RATE = 0.001
+PAPER_STRATEGIES = [
+    {'name': 'default'},
+    {'name': 'fast', 'fast_ma_period': 10, 'slow_ma_period': 30},
+    {'name': 'sma', 'which_ma': 'SMA'},
+    {'name': 'tp5', 'take_profit_percent': 5},
+]
+paper_strategy_settings = ['name', 'fast_ma_period', 'slow_ma_period', 'which_ma', 'transact_amount', 'sell_to_buy_ratio', 'take_profit_percent']
+
 # Safety checks:
 assert(default_ma_window in allowed_candle_windows)
 for symbol in MA_WINDOW:
-    assert(MA_WINDOW[symbol] in allowed_candle_windows)
\ No newline at end of file
+    assert(MA_WINDOW[symbol] in allowed_candle_windows)
+account_names = ['main'] + [account['name'] for account in ACCOUNTS]
+assert(len(set(name.casefold() for name in account_names)) == len(account_names))
+assert(len(set(strategy['name'] for strategy in PAPER_STRATEGIES)) == len(PAPER_STRATEGIES))
+for strategy in PAPER_STRATEGIES:
+    assert(all(setting in paper_strategy_settings for setting in strategy))
+assert((CONTROL_API_PORT is None and CONTROL_API_SOCKET is None) or CONTROL_API_TOKEN)
\ No newline at end of file
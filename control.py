@@ -0,0 +1,131 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" A small HTTP API for controlling the bot, served from the bot's own event loop.
+
+GET  /state    -- the state of the bot as JSON (see Trader.snapshot)
+POST /command  -- runs the console command in the request body, e.g. "sell ETH-USDT $10", and returns the reply as JSON
+
+Every request must carry the header "Authorization: Bearer <token>". Requests from web pages (those with an Origin
+header, or a Host other than the address served on) are refused, so a page open in a browser can't place orders or
+read the balances, even though it can reach 127.0.0.1.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+
+MAX_BODY_SIZE = 4096
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class ControlServer:
+    """ Serves the control API for a Trader on a local TCP port, or on a Unix socket if path is given.
+    Only requests with the given token are served. """
+    def __init__(self, trader, token: str, port: int = None, path: str = None, host: str = '127.0.0.1'):
+        assert(token)
+        self.trader = trader
+        self.token = token.encode()
+        self.port = port
+        self.path = path
+        self.host = host
+        self.server = None
+
+    async def start(self):
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.server = await asyncio.start_unix_server(self.handle_connection, path = self.path)
+            # Only the user running the bot may control it
+            os.chmod(self.path, 0o600)
+            logging.info(f" Control API listening on {self.path}")
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host = self.host, port = self.port)
+            # The port chosen by the system, if port was 0
+            self.port = self.server.sockets[0].getsockname()[1]
+            logging.info(f" Control API listening on {self.host}:{self.port}")
+
+    async def serve(self):
+        """ Serves until the trader stops. """
+        await self.start()
+        while self.trader.running:
+            await self.trader.clock.sleep(1)
+        self.server.close()
+        await self.server.wait_closed()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, body = await self.handle_request(reader)
+        except Exception as e:
+            logging.info(f" Control API error: {e!r}")
+            status, body = 500, {'error': repr(e)}
+        data = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader):
+        """ Returns (status code, JSON body) for one request. """
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) < 2:
+            return 400, {'error': 'bad request'}
+        method, path = request_line[0].upper(), request_line[1].split('?')[0]
+        # { lower case name : value }
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if line == '':
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().casefold()] = value.strip()
+        if not self.authorized(headers):
+            return 401, {'error': 'missing or wrong token'}
+        if not self.local(headers):
+            return 403, {'error': 'requests from web pages are not accepted'}
+        content_length = int(headers.get('content-length', 0))
+        if content_length > MAX_BODY_SIZE:
+            return 400, {'error': 'request too large'}
+        body = (await reader.readexactly(content_length)).decode() if content_length > 0 else ''
+
+        if path == '/state':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            return 200, self.trader.snapshot()
+        if path == '/command':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            if body.strip().casefold() == 'breakpoint':
+                return 400, {'error': 'breakpoint is only available from the console'}
+            return 200, {'reply': await self.trader.execute_command(body)}
+        return 404, {'error': f'unknown path {path}'}
+
+    def authorized(self, headers: dict):
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        return scheme.casefold() == 'bearer' and hmac.compare_digest(token.strip().encode(), self.token)
+    def local(self, headers: dict):
+        """ False for requests a browser sends on behalf of a web page: they carry an Origin, and a page that has
+        rebound its own domain name to 127.0.0.1 still sends that name as the Host. """
+        if 'origin' in headers:
+            return False
+        if self.path is not None:
+            # Browsers can't reach a Unix socket
+            return True
+        return headers.get('host', '').casefold() in {f"{host}:{self.port}" for host in (self.host, 'localhost')}
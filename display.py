@@ -12,14 +12,12 @@
 
 from collections import deque
 import time
-from dateutil.parser import parse as parse_time
 from typing import Callable
 
 import logging
 
+from clock import SYSTEM_CLOCK
 
-def get_age_of_time(t):
-    return time.time() - time.mktime(parse_time(t).timetuple())
 
 class Display:
     def __init__(self, *lines: str, num_lines: int = None, width: int = None, callback: Callable = lambda x: None, priority: float = 0):
@@ -61,19 +59,34 @@ class Display:
 
 class TimedDisplay(Display):
     """ Entries are automatically timestamped and deleted after a set time. """
-    def __init__(self, *args, disappear_time: float = float('Inf'), time_format: str = '%X', **kwargs):
+    def __init__(self, *args, disappear_time: float = float('Inf'), time_format: str = '%X', clock = SYSTEM_CLOCK, **kwargs):
         self.time_format = time_format
         self.disappear_time = disappear_time
+        self.clock = clock
         self.logger = None
+        # Time each line was added, in step with self.lines
+        self.times = deque(maxlen=kwargs.get('num_lines'))
         super().__init__(*args, **kwargs)
     def __str__(self):
         self.rm_old_lines()
         return super().__str__()
     def feedlines(self, *lines: str):
         self.rm_old_lines()
-        super().feedlines(*[f"[{time.strftime(self.time_format)}] {l}" for l in lines])
+        now = self.clock.time()
+        stamp = time.strftime(self.time_format, time.localtime(now))
+        self.times.extend([now]*len(lines))
+        super().feedlines(*[f"[{stamp}] {l}" for l in lines])
+    def setlines(self, *lines: str):
+        self.times = deque([self.clock.time()]*len(lines), maxlen=self.num_lines)
+        super().setlines(*lines)
+    def clear(self):
+        self.times = deque(maxlen=self.num_lines)
+        super().clear()
     def rm_old_lines(self):
-        self.lines = deque( filter(lambda l: get_age_of_time(l.split(']')[0][1:]) < self.disappear_time, self.lines), maxlen=self.num_lines) 
+        now = self.clock.time()
+        while len(self.times) > 0 and now - self.times[0] >= self.disappear_time:
+            self.times.popleft()
+            self.lines.popleft()
 
 class ConsoleInterface:
     """ Formats its own data and nicely displays them to console """
@@ -0,0 +1,222 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" Technical indicators as NumPy kernels.
+
+Every function works on the last axis of its inputs, oldest value first, so a 2D array holds one market per row.
+Full-series functions return arrays of the same length as their input (padded with NaN where the indicator is
+not yet defined). The *_last functions return only the most recent value and only look at as much history as can
+still affect it, so they never build the full series.
+Exponential averages follow the pandas conventions: ewm(span=period, adjust=...).mean().
+"""
+
+import numpy as np
+
+# Weights smaller than this (relative to the newest one) cannot change a float64 result
+_NEGLIGIBLE_WEIGHT = 1e-17
+# Decay powers are rescaled in blocks so they stay within exp(+-_MAX_EXPONENT)
+_MAX_EXPONENT = 300
+
+
+def _decay_filter(x, decay, init=0.0):
+    """ Returns s where s[t] = decay*s[t-1] + x[t] along the last axis, and s[-1] = init.
+    decay may be a scalar, or have shape (rows, 1) to give each row of a 2D x its own decay. """
+    x = np.asarray(x, dtype=float)
+    decay = np.asarray(decay, dtype=float)
+    out = np.empty_like(x)
+    T = x.shape[-1]
+    if T == 0:
+        return out
+    with np.errstate(divide='ignore'):
+        block = max(1, int(_MAX_EXPONENT / -np.log(decay.min())))
+    carry = np.broadcast_to(np.asarray(init, dtype=float), x.shape[:-1])
+    for start in range(0, T, block):
+        xb = x[..., start:start + block]
+        k = np.arange(xb.shape[-1])
+        up = decay**k
+        s = up*np.cumsum(xb / up, axis=-1) + decay*up*carry[..., None]
+        out[..., start:start + block] = s
+        carry = s[..., -1]
+    return out
+
+def _tail_length(decay):
+    """ Number of samples that can still affect the latest value of an exponential average. """
+    if decay <= 0:
+        return 1
+    return int(np.ceil(np.log(_NEGLIGIBLE_WEIGHT) / np.log(decay))) + 1
+
+def _ewm(x, alpha, adjust):
+    x = np.asarray(x, dtype=float)
+    decay = 1 - alpha
+    if adjust:
+        T = x.shape[-1]
+        weights = (1 - np.asarray(decay)**np.arange(1, T + 1)) / alpha
+        return _decay_filter(x, decay) / weights
+    z = alpha*x
+    z[..., :1] = x[..., :1]
+    return _decay_filter(z, decay)
+
+def _ewm_last(x, alpha, adjust):
+    x = np.asarray(x, dtype=float)
+    decay = 1 - alpha
+    x = x[..., -_tail_length(decay):]
+    m = x.shape[-1]
+    weights = decay**np.arange(m - 1, -1, -1, dtype=float)
+    if adjust:
+        return (x @ weights) / weights.sum()
+    weights[1:] *= alpha
+    return x @ weights
+
+def _span_alpha(period):
+    return 2/(1 + np.asarray(period, dtype=float))
+
+
+def sma(prices, period):
+    """ Simple moving average. For 2D prices, period may also be a sequence giving each row its own period.
+    Entries without a full window of non-NaN prices behind them are NaN. """
+    prices = np.asarray(prices, dtype=float)
+    x = np.atleast_2d(prices)
+    n, T = x.shape
+    periods = np.broadcast_to(np.asarray(period, dtype=int), (n,))[:, None]
+    valid = ~np.isnan(x)
+    zero = np.zeros((n, 1))
+    sums = np.concatenate([zero, np.cumsum(np.where(valid, x, 0), axis=1)], axis=1)
+    counts = np.concatenate([zero, np.cumsum(valid, axis=1)], axis=1)
+    starts = np.arange(1, T + 1)[None, :] - periods
+    in_range = starts >= 0
+    starts = np.clip(starts, 0, None)
+    window_sum = sums[:, 1:] - np.take_along_axis(sums, starts, axis=1)
+    window_count = counts[:, 1:] - np.take_along_axis(counts, starts, axis=1)
+    out = np.where(in_range & (window_count == periods), window_sum / periods, np.nan)
+    return out.reshape(prices.shape)
+
+def sma_last(prices, period):
+    """ Most recent value of sma(prices, period). """
+    prices = np.asarray(prices, dtype=float)
+    if prices.shape[-1] < period:
+        return np.full(prices.shape[:-1], np.nan)[()]
+    return prices[..., -period:].mean(axis=-1)
+
+def ema(prices, period, adjust=False):
+    """ Exponential moving average, seeded with the first price. Prices must not contain NaN.
+    For 2D prices, period may also be a sequence giving each row its own period. """
+    prices = np.asarray(prices, dtype=float)
+    alpha = _span_alpha(period)
+    if alpha.ndim == 1:
+        alpha = alpha[:, None]
+    return _ewm(prices, alpha, adjust)
+
+def ema_last(prices, period, adjust=False):
+    """ Most recent value of ema(prices, period, adjust). """
+    return _ewm_last(prices, float(_span_alpha(period)), adjust)
+
+def ema_seeded(prices, period, seed):
+    """ Exponential moving average that starts from the first available (non-NaN) value of seed, e.g. the SMA,
+    like MarketData, rather than from the first price. NaN until then.
+    For 2D prices, period may also be a sequence giving each row its own period. """
+    prices = np.asarray(prices, dtype=float)
+    seed = np.asarray(seed, dtype=float)
+    alpha = _span_alpha(period)
+    ema = np.full(prices.shape, np.nan)
+    prev = np.full(prices.shape[:-1], np.nan)
+    for t in range(prices.shape[-1]):
+        stepped = alpha*prices[..., t] + (1 - alpha)*prev
+        prev = np.where(np.isnan(prev), seed[..., t], stepped)
+        ema[..., t] = prev
+    return ema
+
+def rsi(prices, period):
+    """ Relative strength index using exponential averages of up and down moves.
+    Like a price difference series, the result is one entry shorter than prices. """
+    delta = np.diff(np.asarray(prices, dtype=float), axis=-1)
+    alpha = float(_span_alpha(period))
+    # Average the up and down moves in one pass
+    up, down = _ewm(np.stack([np.clip(delta, 0, None), -np.clip(delta, None, 0)]), alpha, adjust=True)
+    return _rs_to_rsi(up, down)
+
+def rsi_last(prices, period):
+    """ Most recent value of rsi(prices, period). """
+    alpha = float(_span_alpha(period))
+    prices = np.asarray(prices, dtype=float)[..., -_tail_length(1 - alpha) - 1:]
+    delta = np.diff(prices, axis=-1)
+    up = _ewm_last(np.clip(delta, 0, None), alpha, adjust=True)
+    down = _ewm_last(-np.clip(delta, None, 0), alpha, adjust=True)
+    return _rs_to_rsi(up, down)
+
+def _rs_to_rsi(up, down):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # RSI is 100 if all up moves, and NaN if there were no moves at all
+        return 100.0 - 100.0/(1.0 + up/down)
+
+def macd(prices, fast=12, slow=26, signal=9):
+    """ Returns (macd, signal, histogram) series. """
+    line = ema(prices, fast) - ema(prices, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+def macd_last(prices, fast=12, slow=26, signal=9):
+    """ Most recent values of macd(prices, fast, slow, signal) as a tuple. """
+    slow_decay = 1 - float(_span_alpha(max(fast, slow)))
+    signal_decay = 1 - float(_span_alpha(signal))
+    prices = np.asarray(prices, dtype=float)[..., -(_tail_length(slow_decay) + _tail_length(signal_decay)):]
+    line, signal_line, hist = macd(prices, fast, slow, signal)
+    return line[..., -1], signal_line[..., -1], hist[..., -1]
+
+def true_range(high, low, close):
+    """ True range of each candle. The first candle has no previous close, so it uses high - low. """
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    prev_close = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    tr[..., 0] = high[..., 0] - low[..., 0]
+    return tr
+
+def atr(high, low, close, period=14):
+    """ Average true range, using Wilder's smoothing (alpha = 1/period). """
+    return _ewm(true_range(high, low, close), 1/period, adjust=False)
+
+def atr_last(high, low, close, period=14):
+    """ Most recent value of atr(high, low, close, period). """
+    n = _tail_length(1 - 1/period) + 1
+    truncated = np.shape(close)[-1] > n
+    high, low, close = (np.asarray(a, dtype=float)[..., -n:] for a in (high, low, close))
+    tr = true_range(high, low, close)
+    if truncated:
+        # Drop the first candle of the tail, since its previous close was cut off
+        tr = tr[..., 1:]
+    return _ewm_last(tr, 1/period, adjust=False)
+
+def bollinger(prices, period=20, num_std=2.0):
+    """ Returns (middle, upper, lower) Bollinger bands, using the population standard deviation. """
+    prices = np.asarray(prices, dtype=float)
+    middle = np.full(prices.shape, np.nan)
+    std = np.full(prices.shape, np.nan)
+    if prices.shape[-1] >= period:
+        # Running sums of prices shifted by their mean keep the variance accurate
+        x = prices - prices.mean(axis=-1, keepdims=True)
+        pad = np.zeros(x.shape[:-1] + (1,))
+        cs = np.concatenate([pad, np.cumsum(x, axis=-1)], axis=-1)
+        cs2 = np.concatenate([pad, np.cumsum(x*x, axis=-1)], axis=-1)
+        mean = (cs[..., period:] - cs[..., :-period]) / period
+        var = (cs2[..., period:] - cs2[..., :-period]) / period - mean*mean
+        middle[..., period - 1:] = mean + (prices - x)[..., period - 1:]
+        std[..., period - 1:] = np.sqrt(np.clip(var, 0, None))
+    return middle, middle + num_std*std, middle - num_std*std
+
+def bollinger_last(prices, period=20, num_std=2.0):
+    """ Most recent values of bollinger(prices, period, num_std) as a tuple. """
+    prices = np.asarray(prices, dtype=float)
+    if prices.shape[-1] < period:
+        nan = np.full(prices.shape[:-1], np.nan)[()]
+        return nan, nan, nan
+    window = prices[..., -period:]
+    middle = window.mean(axis=-1)
+    std = window.std(axis=-1)
+    return middle, middle + num_std*std, middle - num_std*std
@@ -14,20 +14,34 @@
 
 # Imports for builtin modules:
 from collections import defaultdict
+import functools
 import sys, cmd
+import os
+import importlib
 import datetime
 from dateutil.parser import parse as datetime_parser
 import time
 import logging
-logging.basicConfig(filename='detailed_info.log', level=logging.INFO, format = '%(asctime)-15s%(message)s')
+from logging.handlers import RotatingFileHandler
+
+try:
+    import config
+    from config import *
+except ModuleNotFoundError:
+    print("No config.py file found.")
+    quit()
+
+# Log files are rotated once they reach LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files
+detailed_info_handler = RotatingFileHandler(filename='detailed_info.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+logging.basicConfig(handlers=[detailed_info_handler], level=logging.INFO, format = '%(asctime)-15s%(message)s')
 
 high_priority_info_log = logging.getLogger('high_priority_info_log')
-high_priority_info_handler = logging.FileHandler(filename='trades.log')
+high_priority_info_handler = RotatingFileHandler(filename='trades.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
 high_priority_info_handler.setFormatter(logging.Formatter('%(message)s'))
 high_priority_info_log.addHandler(high_priority_info_handler)
 
 low_priority_info_log = logging.getLogger('low_priority_info_log')
-low_priority_info_handler = logging.FileHandler(filename='messages.log')
+low_priority_info_handler = RotatingFileHandler(filename='messages.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
 low_priority_info_handler.setFormatter(logging.Formatter('%(message)s'))
 low_priority_info_log.addHandler(low_priority_info_handler)
 
@@ -37,18 +51,20 @@ from concurrent.futures import ThreadPoolExecutor
 
 # Imports for installed modules:
 from kucoin.client import Client
-from kucoin.asyncio import KucoinSocketManager
 from kucoin.exceptions import KucoinAPIException
 
 # Imports for custom modules:
 from display import *
 from util import *
-
-try:
-    from config import *
-except ModuleNotFoundError:
-    print("No config.py file found.")
-    quit()
+from clock import SYSTEM_CLOCK
+from recorder import Recorder, RecordingClient
+from control import ControlServer
+from profiler import LoopWatchdog, SamplingProfiler
+from scheduler import RefreshScheduler
+from paper import PaperBook
+from ledger import Ledger
+from transport import OrderTransport
+from wsclient import KucoinWebsocket
 
 class TxTrigger:
     # Types:
@@ -60,10 +76,223 @@ class TxTrigger:
         self.side = side
         self.kwargs = kwargs
 
+class MarketFeed:
+    """ The public side of the bot: candles, moving averages, crossover signals and tickers of the markets in SYMBOLS.
+    One feed is shared by every account traded (see ACCOUNTS in config.py), so each market is downloaded, subscribed
+    to and evaluated once, however many accounts trade it. client is only used for public requests. """
+    def __init__(self, client, recorder = None, clock = SYSTEM_CLOCK):
+        self.client = client
+        self.clock = clock
+        # If set, every websocket message is recorded (see recorder.py)
+        self.recorder = recorder
+        self.load_symbol_details()
+
+        # For candle data
+        self.market_data = dict()
+        # { symbol : { 'price': float, 'bestBid': float, 'bestAsk': float } }
+        self.orderbook_data = dict()
+        # Simulated strategies, when paper trading (see paper.py)
+        self.paper = None
+        if PAPER_TRADING:
+            self.paper = PaperBook(self.market_data, self.orderbook_data, PAPER_STRATEGIES, default_settings(),
+                                   funds = PAPER_STARTING_FUNDS, fee_rate = PAPER_FEE_RATE)
+        for sym in SYMBOLS:
+            self.market_data[sym] = self.new_market_data(sym)
+        self.scheduler = RefreshScheduler(self.market_data, clock = self.clock, requests_per_second = REST_REQUESTS_PER_SECOND,
+                                          settle_delay = REFRESH_SETTLE_DELAY, jitter = REFRESH_JITTER, ma = WHICH_MA)
+        # Created by ainit()
+        self.websocket = None
+
+    def load_symbol_details(self):
+        symbol_details = self.client.get_symbols()
+        self.symbol_details = dict()
+        for sd in symbol_details:
+            if sd['symbol'] in SYMBOLS:
+                self.symbol_details[sd['symbol']] = sd
+        logging.info(f" symbol details: {self.symbol_details}")
+
+    def new_market_data(self, sym):
+        md = MarketData(self.client, sym, MA_WINDOW[sym], moving_averages=(FAST_MA_PERIOD[sym], SLOW_MA_PERIOD[sym]), clock=self.clock,
+                        min_history=self.min_history(sym))
+        md.set_live_confirmation(LIVE_CONFIRM_TICKS, LIVE_CONFIRM_SECONDS, LIVE_CONFIRM_SEPARATION)
+        return md
+    def min_history(self, sym):
+        """ Number of candles the paper strategies need, beyond what the live strategy needs. """
+        return 0 if self.paper is None else self.paper.history_needed(sym)
+
+    def set_lp_display(self, display):
+        self.lp_display = display
+    def stop(self):
+        self.scheduler.stop()
+        if self.websocket is not None:
+            self.websocket.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def check_signals(self):
+        """ Returns a list of (symbol, 'bullish' or 'bearish') for every market whose MA crossover has just occurred. """
+        if self.paper is not None:
+            # The paper strategies trade their simulated accounts instead, and no real orders are placed
+            self.paper.evaluate()
+            return []
+        crossovers = []
+        for sym in SYMBOLS:
+            ma_crossover, first_occur = self.market_data[sym].get_ma_crossover(ma=WHICH_MA)
+            if ma_crossover is not None and first_occur is True:
+                crossovers.append((sym, ma_crossover))
+        if LIVE_CANDLES:
+            # A crossover already acted on while its candle was forming isn't acted on again once it closes
+            crossovers = [(sym, c) for sym, c in crossovers
+                          if self.market_data[sym].live_signal != (self.market_data[sym]._last_time(), c)]
+        for sym, ma_crossover in crossovers:
+            close = self.market_data[sym].get_last_close()
+            self.lp_display.feedlines(f"{sym}: {WHICH_MA} crossover is {ma_crossover} at {close}")
+        if LIVE_CANDLES:
+            now = self.clock.time()
+            for sym in SYMBOLS:
+                pending, first_occur = self.market_data[sym].get_live_crossover(ma=WHICH_MA, now=now)
+                if pending is not None and first_occur is True:
+                    self.lp_display.feedlines(f"{sym}: {WHICH_MA} crossover is {pending} before the candle closes, " +
+                                              f"at {self.market_data[sym].live[2]}")
+                    crossovers.append((sym, pending))
+        return crossovers
+
+    def repr_lines(self):
+        lines = []
+        lines.append('\t'.join(['Symbol',' ','Bid', 'Ask', 'Close', 'Fast MA', 'Slow MA', 'Cross']))
+        for sym in SYMBOLS:
+            ma = self.market_data[sym].get_last_ma(ma = WHICH_MA)
+            close = self.market_data[sym].get_last_close()
+            ma_crossover, _ = self.market_data[sym].get_ma_crossover(ma=WHICH_MA, mark=False)
+            pending = self.market_data[sym].get_pending_crossover(ma=WHICH_MA)
+            if ma_crossover is None and pending is not None:
+                # Where the forming candle is heading
+                ma_crossover = f"{pending}?"
+            if len(sym) >= 8:
+                num_tabs = 1
+            else:
+                num_tabs = 2
+            try:
+                bid = self.orderbook_data[sym]['bestBid']
+                ask = self.orderbook_data[sym]['bestAsk']
+            except KeyError:
+                bid = 0
+                ask = 0
+            lines.append(f"{sym}" + "\t"*num_tabs +
+                         f"{pad_or_trim(bid)}\t"
+                         f"{pad_or_trim(ask)}\t"
+                         f"{pad_or_trim(close)}\t" +
+                         f"{pad_or_trim(ma[0])}\t" +
+                         f"{pad_or_trim(ma[1])}\t" +
+                         f"{ma_crossover}")
+        if self.paper is not None:
+            lines.append('\t'.join(['Strategy', ' ', 'Value', 'PnL', 'PnL %', 'Fills', 'Fees']))
+            for name, value, profit, fills, fees in self.paper.results():
+                lines.append(f"{name[:15]}" + "\t"*(1 if len(name) >= 8 else 2) +
+                             f"{pad_or_trim(value)}\t"
+                             f"{pad_or_trim(profit)}\t"
+                             f"{pad_or_trim(100*profit/PAPER_STARTING_FUNDS)}\t"
+                             f"{fills}\t"
+                             f"{pad_or_trim(fees)}")
+        return lines
+
+    def on_ticker(self, symbol, msg):
+        # Only keep what is used, rather than the whole message
+        data = msg['data']
+        self.orderbook_data[symbol] = {
+            'price': float(data['price']),
+            'bestBid': float(data['bestBid']),
+            'bestAsk': float(data['bestAsk']),
+        }
+        if LIVE_CANDLES and symbol in self.market_data:
+            self.market_data[symbol].on_tick(float(data['price']), self.clock.time())
+        if self.paper is not None:
+            self.paper.on_ticker(symbol)
+    async def handle_evt(self, msg):
+        """ Handles a message that didn't come through self.websocket, e.g. from a replay. """
+        if msg.get('subject') == 'trade.ticker':
+            self.on_ticker(msg['topic'].split(':')[-1], msg)
+
+    async def subscribe(self, symbol):
+        await self.websocket.subscribe(f'/market/ticker:{symbol}', functools.partial(self.on_ticker, symbol))
+
+    async def ainit(self):
+        self.tasks = []
+        record = None
+        if self.recorder is not None:
+            record = self.recorder.record_raw_message
+            self.tasks.append(asyncio.create_task(self.recorder.auto_flush()))
+        self.websocket = KucoinWebsocket(self.client, record = record, clock = self.clock)
+        for sym in SYMBOLS:
+            await self.subscribe(sym)
+        self.tasks.append(asyncio.create_task(self.websocket.run()))
+        self.tasks.append(asyncio.create_task(self.scheduler.run()))
+        await asyncio.gather(*self.tasks)
+
+    async def apply_config(self):
+        """ Brings the markets in line with a reloaded config.py, keeping the market data that is still valid.
+        Returns the lists of added and removed symbols. """
+        # Everything up to the first await runs in one go, so no other task sees SYMBOLS and market_data disagree
+        removed = [sym for sym in self.market_data if sym not in SYMBOLS]
+        added = [sym for sym in SYMBOLS if sym not in self.market_data]
+        if len(added) > 0:
+            self.load_symbol_details()
+        if self.paper is not None:
+            self.paper.configure(PAPER_STRATEGIES, default_settings())
+        for sym in removed:
+            self._remove_market(sym)
+            self.orderbook_data.pop(sym, None)
+        reloaded = []
+        for sym in SYMBOLS:
+            if sym in added:
+                continue
+            md = self.market_data[sym]
+            if MA_WINDOW[sym] != md.candle_period:
+                # Candles of a different size can't be reused
+                self._remove_market(sym)
+                reloaded.append(sym)
+            else:
+                md.set_ma_periods((FAST_MA_PERIOD[sym], SLOW_MA_PERIOD[sym]), min_history=self.min_history(sym))
+                md.set_live_confirmation(LIVE_CONFIRM_TICKS, LIVE_CONFIRM_SECONDS, LIVE_CONFIRM_SEPARATION)
+        for sym in added + reloaded:
+            self.market_data[sym] = self.new_market_data(sym)
+            self.scheduler.reschedule(sym)
+        self.scheduler.ma = WHICH_MA
+
+        if self.websocket is not None:
+            for sym in removed:
+                await self.websocket.unsubscribe(f'/market/ticker:{sym}')
+            for sym in added:
+                await self.subscribe(sym)
+        return added, removed
+
+    def _remove_market(self, sym):
+        del self.market_data[sym]
+        self.scheduler.reschedule(sym)
+
 class KucoinClient(Client):
-    def __init__(self, client):
+    """ One KuCoin account: its balances, orders and private websocket.
+    The market data comes from feed, which is created here unless it is shared with other accounts. name and
+    overrides identify the account and the settings it changes for itself (see ACCOUNTS in config.py).
+    Fills are kept in a ledger of positions, saved to ledger_path if given. Orders are sent through transport (see
+    transport.py) if given, otherwise through client. """
+    def __init__(self, client, recorder = None, clock = SYSTEM_CLOCK, feed = None, name = 'main', overrides = None,
+                 ledger_path = None, transport = None):
         self.client = client
-        accounts = self.client.get_accounts()
+        self.transport = transport
+        # Places and cancels orders
+        self.order_client = client if transport is None else transport
+        if transport is not None and recorder is not None:
+            self.order_client = RecordingClient(transport, recorder)
+        self.feed = MarketFeed(client, recorder = recorder, clock = clock) if feed is None else feed
+        self.clock = self.feed.clock
+        # If set, every private websocket message is recorded (see recorder.py)
+        self.recorder = recorder
+        self.name = name
+        # { setting : value, or { symbol : value } }
+        self.overrides = dict() if overrides is None else overrides
+        # Paper trading needs no account, so it also works without an API key
+        accounts = [] if PAPER_TRADING else self.client.get_accounts()
         self.accounts = defaultdict(dict)
         for a in accounts:
             self.accounts[a['type']][a['currency']] = {
@@ -71,7 +300,7 @@ class KucoinClient(Client):
                  'balance': float(a['balance']),
                  'holds': float(a['holds']),
                  'id': a['id'],
-                 'time': time.time()
+                 'time': self.clock.time()
                  }
         time.sleep(0.001)
         symlist = self.client.get_currencies()
@@ -80,36 +309,38 @@ class KucoinClient(Client):
         for sl in symlist:
             self.currency_precision[sl['currency']] = sl['precision']
 
-        time.sleep(0.001)
-        symbol_details = self.client.get_symbols()
-        self.symbol_details = dict()
-        for sd in symbol_details:
-            if sd['symbol'] in SYMBOLS:
-                self.symbol_details[sd['symbol']] = sd
-        logging.info(f" symbol details: {self.symbol_details}")
-
         self.triggers = []
-        # For candle data
-        self.market_data = dict()
-        for sym in SYMBOLS:
-            self.market_data[sym] = MarketData(self.client, sym, MA_WINDOW[sym], moving_averages=(FAST_MA_PERIOD[sym], SLOW_MA_PERIOD[sym]))
-        self.orderbook_data = defaultdict(dict)
+        # Shared with the feed (and any other accounts)
+        self.market_data = self.feed.market_data
+        self.orderbook_data = self.feed.orderbook_data
 
         # { symbol : { 'buy': float, 'sell': float } }
-        self.last_fill_price = defaultdict(lambda: defaultdict(float))
+        self.last_fill_price = dict()
+        self.ledger = Ledger(ledger_path)
+
+        # Private messages, by topic
+        self.topic_handlers = {
+            '/spotMarket/tradeOrders': self.on_order_change,
+            '/account/balance': self.on_balance,
+        }
+        self.websocket = None
+
+    def setting(self, key, symbol):
+        """ The value for symbol of a setting this account may override, e.g. 'transact_amount'. """
+        return lookup_setting(self.overrides, key, symbol, default_settings())
 
     def round_price(self, symbol, price):
-        mm = incr = float(self.symbol_details[symbol]['priceIncrement'])
+        mm = incr = float(self.feed.symbol_details[symbol]['priceIncrement'])
         return self.round(price, mm, float('Inf'), incr)
     def round_size(self, symbol, size):
-        mm = float(self.symbol_details[symbol]['baseMinSize'])
-        MM = float(self.symbol_details[symbol]['baseMaxSize'])
-        incr = float(self.symbol_details[symbol]['baseIncrement'])
-        return self.round(size, mm, MM, incr, truncate = True) 
+        mm = float(self.feed.symbol_details[symbol]['baseMinSize'])
+        MM = float(self.feed.symbol_details[symbol]['baseMaxSize'])
+        incr = float(self.feed.symbol_details[symbol]['baseIncrement'])
+        return self.round(size, mm, MM, incr, truncate = True)
     def round_funds(self, symbol, funds):
-        mm = float(self.symbol_details[symbol]['quoteMinSize'])
-        MM = float(self.symbol_details[symbol]['quoteMaxSize'])
-        incr = float(self.symbol_details[symbol]['quoteIncrement'])
+        mm = float(self.feed.symbol_details[symbol]['quoteMinSize'])
+        MM = float(self.feed.symbol_details[symbol]['quoteMaxSize'])
+        incr = float(self.feed.symbol_details[symbol]['quoteIncrement'])
         return self.round(funds, mm, MM, incr)
     def round(self, value, minimum, maximum, increment, truncate = False):
         value = min(value, maximum)
@@ -121,37 +352,42 @@ class KucoinClient(Client):
             return float(f"{whole}.{frac}")
         return round(value, precision)
 
-    def sell_all(self, symbol):
-        self.cancel_all_orders(symbol)
+    async def sell_all(self, symbol):
+        await self.cancel_all_orders(symbol)
         funds = self.round_funds(symbol, float('Inf'))
-        o = self.client.create_market_order(symbol, Client.SIDE_SELL, funds = funds)
+        o = await self.send_order('create_market_order', symbol, Client.SIDE_SELL, funds = funds)
         logging.info(o)
 
 
-    def buy_all(self, symbol):
+    async def buy_all(self, symbol):
         # sym = symbol.split('-')[0]
         currency = symbol.split('-')[1]
         avail = self.accounts['trade'][currency]['available']
         # rounding = self.currency_precision[currency]
 
-        o = self.client.create_market_order(symbol, Client.SIDE_BUY, funds = avail)
+        o = await self.send_order('create_market_order', symbol, Client.SIDE_BUY, funds = avail)
         logging.info(o)
 
-    def cancel_all_orders(self, symbol=None):
-        if symbol is None: 
-            info = self.client.cancel_all_orders(symbol = symbol)
+    async def send_order(self, method: str, *args, **kwargs):
+        """ Calls method (create_market_order, cancel_order etc.) of the order client and returns the reply. The event
+        loop carries on while a request of the transport is out; the kucoin Client's hold it up. """
+        reply = getattr(self.order_client, method)(*args, **kwargs)
+        if asyncio.iscoroutine(reply):
+            reply = await reply
+        return reply
+    async def cancel_all_orders(self, symbol=None):
+        if symbol is None:
+            info = await self.send_order('cancel_all_orders', symbol = symbol)
             logging.info(f" Canceled order: {info}")
         else:
-            o = self.client.get_orders(status='active', symbol=symbol)
+            o = await self.send_order('get_orders', status='active', symbol=symbol)
             oids = [i['id'] for i in o['items']]
             for oid in oids:
-                info = self.client.cancel_order(oid)
+                info = await self.send_order('cancel_order', oid)
                 logging.info(f" Canceled order: {info}")
-    def stop(self):
-        for sym in SYMBOLS:
-            self.market_data[sym].stop()
-    def create_market_order(self, symbol, side, size=None, funds=None, client_oid=None, remark=None, stp=None):
-        return self.client.create_market_order(symbol, side, size=size, funds=funds, client_oid=client_oid, remark=remark, stp=stp)
+    async def create_market_order(self, symbol, side, size=None, funds=None, client_oid=None, remark=None, stp=None):
+        return await self.send_order('create_market_order', symbol, side, size=size, funds=funds, client_oid=client_oid,
+                                     remark=remark, stp=stp)
     def set_hp_display(self, display):
         self.hp_display = display
     def set_lp_display(self, display):
@@ -161,6 +397,13 @@ class KucoinClient(Client):
         self.triggers = []
         return triggers
 
+    def queue_triggers(self, crossovers):
+        """ Queues a trigger for every (symbol, crossover) given, as returned by MarketFeed.check_signals. """
+        for sym, ma_crossover in crossovers:
+            if ma_crossover == 'bullish': side = Client.SIDE_BUY
+            elif ma_crossover == 'bearish': side = Client.SIDE_SELL
+            self.triggers.append(TxTrigger(sym, TxTrigger.MA_CROSSOVER, side))
+
     def get_account_balance(self, symbol, account_type = 'trade'):
         """ Returns the balance of the given asset in the account """
         symbol = symbol.split('-')[0]
@@ -201,59 +444,32 @@ class KucoinClient(Client):
 
     def repr_lines(self):
         lines = []
-        lines.append('\t'.join(['Symbol', 'ActType', 'Balance', 'Avail', 'Value', 'Fill P.']))
+        lines.append('\t'.join(['Symbol', 'ActType', 'Balance', 'Avail', 'Value', 'Fill P.', 'Avg Cost', 'PnL', 'Real.']))
         # for t in self.accounts:
             # for c in self.accounts[t]:
         # Only show data in trade accounts
         t = 'trade'
+        positions = self.ledger.summary(self.orderbook_data)
         if t in self.accounts:
             for c in self.accounts['trade']:   
-                if self.accounts[t][c]['balance'] > 0:         
+                position = positions.get(c + '-USDT', {}) # Take care when generalizing to other markets
+                if self.accounts[t][c]['balance'] > 0 or position.get('realized'):
                     lines.append(f"{c}\t" +
                                 f"{t}\t" +
                                 f"{pad_or_trim(self.accounts[t][c]['balance'])}\t" +
                                 f"{pad_or_trim(self.accounts[t][c]['available'])}\t" +
                                 f"{pad_or_trim(self.get_account_value(symbol = c))}\t" +
-                                f"{pad_or_trim(self.last_fill_price[c + '-USDT']['buy'])}") # Take care when generalizing to other markets
-        lines.append('\t'.join(['Symbol',' ','Bid', 'Ask', 'Close', 'Fast MA', 'Slow MA', 'Cross']))
-        for sym in SYMBOLS:
-            ma = self.market_data[sym].get_last_ma(ma = WHICH_MA)
-            close = self.market_data[sym].get_last_close()
-            ma_crossover, first_occur = self.market_data[sym].get_ma_crossover(ma=WHICH_MA)
-            if ma_crossover is not None and first_occur is True:
-                self.lp_display.feedlines(f"{sym}: {WHICH_MA} crossover is {ma_crossover} at {close}")
-                if ma_crossover == 'bullish': side = Client.SIDE_BUY
-                elif ma_crossover == 'bearish': side = Client.SIDE_SELL
-                self.triggers.append(TxTrigger(sym, TxTrigger.MA_CROSSOVER, side))
-            if len(sym) >= 8: 
-                num_tabs = 1
-            else:
-                num_tabs = 2
-            try: 
-                bid = self.orderbook_data[sym]['bestBid']
-                ask = self.orderbook_data[sym]['bestAsk']
-            except KeyError:
-                bid = 0
-                ask = 0
-            lines.append(f"{sym}" + "\t"*num_tabs + 
-                         f"{pad_or_trim(bid)}\t"
-                         f"{pad_or_trim(ask)}\t"
-                         f"{pad_or_trim(close)}\t" +
-                         f"{pad_or_trim(ma[0])}\t" +
-                         f"{pad_or_trim(ma[1])}\t" +
-                         f"{ma_crossover}") 
+                                f"{pad_or_trim(self.last_fill_price.get(c + '-USDT', {}).get('buy', 0.0))}\t" + # Take care when generalizing to other markets
+                                f"{pad_or_trim(position.get('average_cost')) or ''}\t" +
+                                f"{pad_or_trim(position.get('unrealized')) or ''}\t" +
+                                f"{pad_or_trim(position.get('realized')) or ''}")
         return lines
 
-    async def handle_evt(self, msg):
-        if msg['subject'] == 'trade.ticker':
-            symbol = msg['topic'].split(':')[-1]
-            self.orderbook_data[symbol] = msg['data']
+    def on_order_change(self, msg):
+        logging.info(f" Order change: {msg}")
+        if msg['data']['type'] != 'match':
             return
-
-        logging.info(f" handle_evt: {msg}")
         try:
-            assert(msg['topic'] == '/spotMarket/tradeOrders')
-            assert(msg['data']['type'] == 'match')
             matchPrice = float(msg['data']['matchPrice'])
             side = msg['data']['side']
             orderType = msg['data']['orderType']
@@ -262,53 +478,69 @@ class KucoinClient(Client):
             total = matchPrice*filledSize
             if symbol.split('-')[1].casefold() == 'usdt':
                 total = '$'+str(total)
-            self.hp_display.feedlines(f"Filled {orderType} {side} {symbol} {filledSize} at {matchPrice}. Total: {total}.")
-            self.last_fill_price[symbol][side] = matchPrice
-        except (KeyError, AssertionError):
-            pass
-        # finally:
-        #     pass
-        if msg['subject'] == 'account.balance':
-            account_type = msg['data']['relationEvent'].split('.')[0]
-            currency = msg['data']['currency']
-            self.accounts[account_type][currency] = {
-                 'available': float(msg['data']['available']),
-                 'balance': float(msg['data']['total']),
-                 'holds': float(msg['data']['hold']),
-                 'id': msg['data']['accountId'],
-                 'time': float(msg['data']['time'])
-                 }
-        
+            account = '' if self.name == 'main' else f"{self.name}: "
+            self.hp_display.feedlines(f"{account}Filled {orderType} {side} {symbol} {filledSize} at {matchPrice}. Total: {total}.")
+            self.last_fill_price.setdefault(symbol, dict())[side] = matchPrice
+            # matchSize is the size of this fill; filledSize is the total filled on the order so far
+            self.ledger.record_fill(symbol, side, float(msg['data'].get('matchSize', filledSize)), matchPrice,
+                                    trade_id = msg['data'].get('tradeId'))
+        except KeyError:
+            logging.info(f" Incomplete fill message: {msg}")
+    def on_balance(self, msg):
+        logging.info(f" Balance change: {msg}")
+        account_type = msg['data']['relationEvent'].split('.')[0]
+        currency = msg['data']['currency']
+        self.accounts[account_type][currency] = {
+             'available': float(msg['data']['available']),
+             'balance': float(msg['data']['total']),
+             'holds': float(msg['data']['hold']),
+             'id': msg['data']['accountId'],
+             'time': float(msg['data']['time'])
+             }
+    async def handle_evt(self, msg):
+        """ Handles a message that didn't come through a websocket, e.g. from a replay. """
+        if msg.get('subject') == 'trade.ticker':
+            await self.feed.handle_evt(msg)
+        elif msg.get('topic') in self.topic_handlers:
+            self.topic_handlers[msg['topic']](msg)
 
     async def ainit(self):
-        global loop
-        self.ksm_priv = await KucoinSocketManager.create(loop, self.client, self.handle_evt, private=True)
-        self.ksm = await KucoinSocketManager.create(loop, self.client, self.handle_evt)
-        await self.ksm_priv.subscribe('/account/balance')
-        await self.ksm_priv.subscribe('/spotMarket/tradeOrders')
-        self.tasks = []
-        for sym in SYMBOLS:
-            await self.ksm.subscribe(f'/market/ticker:{sym}')
-            self.tasks.append(asyncio.create_task(self.market_data[sym].auto_update()))
-        await asyncio.gather(*self.tasks)
+        """ Subscribes to the private messages of the account. Paper trading has none. """
+        if PAPER_TRADING:
+            return
+        record = None if self.recorder is None else self.recorder.record_raw_message
+        self.websocket = KucoinWebsocket(self.client, private = True, record = record, clock = self.clock)
+        for topic, handler in self.topic_handlers.items():
+            await self.websocket.subscribe(topic, handler)
+        await self.websocket.run()
+    def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.websocket is not None:
+            self.websocket.close()
 
 class Trader:
-    """ Class to handle trading instance """
-    def __init__(self, wrapped_client):
+    """ Class to handle trading instance. Trades every account given, which must share one MarketFeed. """
+    def __init__(self, *wrapped_clients, clock = None):
         
         self.running = True
-        self.up_since = time.time()
-
-        self.client = wrapped_client
+        self.clients = list(wrapped_clients)
+        # The account that console commands act on (see the command "account")
+        self.client = self.clients[0]
+        self.feed = self.client.feed
+        assert(all(c.feed is self.feed for c in self.clients))
+        # Runs on the same clock as the client unless told otherwise
+        self.clock = self.feed.clock if clock is None else clock
+        self.up_since = self.clock.time()
 
         # Load orders that may have been placed before this program started
         
         ## Set up the display
         self.display_heading = Display()
         self.display_grid = Display()
-        self.display_high_priority_feed = TimedDisplay(num_lines = 6, priority=10)
+        self.display_high_priority_feed = TimedDisplay(num_lines = 6, priority=10, clock=self.clock)
         self.display_high_priority_feed.set_logger('high_priority_info_log')
-        self.display_low_priority_feed = TimedDisplay(num_lines = 12, priority=0)
+        self.display_low_priority_feed = TimedDisplay(num_lines = 12, priority=0, clock=self.clock)
         self.display_low_priority_feed.set_logger('low_priority_info_log')
         self.display_info_feed = CombinedDisplay(
             self.display_high_priority_feed, 
@@ -321,65 +553,90 @@ class Trader:
             self.display_info_feed
         )
         
-        self.client.set_hp_display(self.display_high_priority_feed)
-        self.client.set_lp_display(self.display_low_priority_feed)
+        for client in self.clients:
+            client.set_hp_display(self.display_high_priority_feed)
+            client.set_lp_display(self.display_low_priority_feed)
+        self.feed.set_lp_display(self.display_low_priority_feed)
+
+        ## Performance diagnostics
+        # Reports go to messages.log, and their stack traces to detailed_info.log; trades.log is kept for trading
+        self.watchdog = LoopWatchdog(LOOP_STALL_THRESHOLD, report = self.display_low_priority_feed.feedlines)
+        self.profiler = None
 
         ## Load existing positions
   
-    def cancel_all_orders(self, symbol=None):
-        info = self.client.cancel_all_orders(symbol = symbol)
+    async def cancel_all_orders(self, symbol=None, client=None):
+        client = self.client if client is None else client
+        info = await client.cancel_all_orders(symbol = symbol)
         logging.info(f" Order canceled: {info}")  
-    def create_limit_order(self, symbol, side, price, size):
-        price = self.client.round_price(symbol, price)
-        size = self.client.round_size(symbol, size)
-        logging.info(f"self.client.client.create_limit_order({symbol}, side = {side}, price = {price}, size = {size})")
-        o = self.client.client.create_limit_order(symbol, side = Client.SIDE_SELL, price = price, size = size)
+    async def create_limit_order(self, symbol, side, price, size, client=None):
+        if PAPER_TRADING:
+            logging.info(f" Paper trading, so no limit order placed for {symbol}.")
+            return None
+        client = self.client if client is None else client
+        price = client.round_price(symbol, price)
+        size = client.round_size(symbol, size)
+        logging.info(f"{client.name}: create_limit_order({symbol}, side = {side}, price = {price}, size = {size})")
+        start = time.perf_counter()
+        o = await client.send_order('create_limit_order', symbol, side = Client.SIDE_SELL, price = price, size = size)
+        logging.info(f"{client.name}: limit order acknowledged in {(time.perf_counter() - start)*1000:.1f} ms")
         print(o)
         return o
 
-    def create_market_order(self, symbol, side, size=None, funds=None, client_oid=None, remark=None, stp=None):
+    async def create_market_order(self, symbol, side, size=None, funds=None, client_oid=None, remark=None, stp=None, client=None):
         o = None
-        if size is not None: size = self.client.round_size(symbol, size)
-        if funds is not None: funds = self.client.round_funds(symbol, funds)
+        if PAPER_TRADING:
+            logging.info(f" Paper trading, so no market order placed for {symbol}.")
+            return o
+        client = self.client if client is None else client
+        if size is not None: size = client.round_size(symbol, size)
+        if funds is not None: funds = client.round_funds(symbol, funds)
+        start = time.perf_counter()
         try:
-            o = self.client.create_market_order(symbol, side, size=size, funds=funds, client_oid=client_oid, remark=remark, stp=stp)
+            o = await client.create_market_order(symbol, side, size=size, funds=funds, client_oid=client_oid, remark=remark, stp=stp)
+            logging.info(f"{client.name}: market order acknowledged in {(time.perf_counter() - start)*1000:.1f} ms")
         except KucoinAPIException as e:
             logging.info(f" Tried to {side} {symbol}, but {e}.")
         print(o)
         logging.info(f" Market order: {o}")
         return o
 
-    async def main_loop(self, sleep_time = MAIN_LOOP_SLEEP_TIME, loops = float("Inf")):
-        """Main loop which calls other functions/strategies. Also handles the display."""
+    async def main_loop(self, sleep_time = None, loops = float("Inf")):
+        """Main loop which calls other functions/strategies. Also handles the display.
+        Sleeps for MAIN_LOOP_SLEEP_TIME between iterations unless sleep_time is given."""
 
         # Wait to let market data load
-        await asyncio.sleep(3)
+        await self.clock.sleep(3)
         i = 0        
         while i < loops and self.running:
-            self.update_display()
-            triggers = self.client.pop_triggers()
-            for t in triggers:
-                asyncio.get_event_loop().create_task(self.handle_trigger(t))
-            await asyncio.sleep(sleep_time)
+            # Signals are computed once and every account acts on them
+            crossovers = self.feed.check_signals()
+            self.redraw()
+            for client in self.clients:
+                client.queue_triggers(crossovers)
+                for t in client.pop_triggers():
+                    asyncio.get_event_loop().create_task(self.handle_trigger(t, client))
+            await self.clock.sleep(MAIN_LOOP_SLEEP_TIME if sleep_time is None else sleep_time)
             i += 1
         self.running = False
 
-    async def handle_trigger(self, t):
+    async def handle_trigger(self, t, client = None):
+        client = self.client if client is None else client
         if t.type == TxTrigger.MA_CROSSOVER:
-            amt = TRANSACT_AMOUNT[t.symbol]
+            amt = client.setting('transact_amount', t.symbol)
             if t.side == Client.SIDE_SELL:
-                amt = SELL_TO_BUY_RATIO[t.symbol]*TRANSACT_AMOUNT[t.symbol]
-                self.cancel_all_orders(symbol = t.symbol)
-                await asyncio.sleep(0.01)
+                amt = client.setting('sell_to_buy_ratio', t.symbol)*client.setting('transact_amount', t.symbol)
+                await self.cancel_all_orders(symbol = t.symbol, client = client)
+                await self.clock.sleep(0.01)
             
-            self.create_market_order(t.symbol, t.side, funds = amt)
+            await self.create_market_order(t.symbol, t.side, funds = amt, client = client)
             
             if t.side == Client.SIDE_BUY:
-                await asyncio.sleep(2)
-                self.cancel_all_orders(symbol = t.symbol)
-                price = float(self.client.orderbook_data[t.symbol]['price'])*(100+TAKE_PROFIT_PERCENT[t.symbol])/100
-                size = self.client.get_account_balance(symbol = t.symbol)
-                self.create_limit_order(t.symbol, side = Client.SIDE_SELL, price = price, size = size)
+                await self.clock.sleep(2)
+                await self.cancel_all_orders(symbol = t.symbol, client = client)
+                price = float(client.orderbook_data[t.symbol]['price'])*(100+client.setting('take_profit_percent', t.symbol))/100
+                size = client.get_account_balance(symbol = t.symbol)
+                await self.create_limit_order(t.symbol, side = Client.SIDE_SELL, price = price, size = size, client = client)
 
     def update_display(self):
         horiz_line = '─'
@@ -392,82 +649,292 @@ class Trader:
         line_size = 8*12
         lines = []
         lines += [f"{top_left_corner}{horiz_line*(line_size-5)}{top_right_corner}"]
-        heading = f"{vert_line}{time.ctime()} │ " + \
-                  f"Uptime: {datetime.timedelta(seconds = int(time.time()-self.up_since))}  │ " + \
-                  f"Total Value: ${round(self.client.get_account_value(), 5)}"
+        heading = f"{vert_line}{time.ctime(self.clock.time())} │ " + \
+                  f"Uptime: {datetime.timedelta(seconds = int(self.clock.time()-self.up_since))}  │ " + \
+                  f"Total Value: ${round(self.total_value(), 5)}"
         heading = heading + f"{' '*(line_size-len(heading)-4)}{vert_line}"
         lines += [heading]
         lines += [f"{bot_left_corner}{horiz_line*(line_size-5)}{bot_right_corner}"]
         self.display_heading.setlines(*lines)
 
         # Grid
-        self.display_grid.setlines(*self.client.repr_lines())
+        lines = []
+        for client in self.clients:
+            if len(self.clients) > 1:
+                lines.append(f"Account: {client.name}")
+            lines += client.repr_lines()
+        self.display_grid.setlines(*lines, *self.feed.repr_lines())
 
         print(self.display)
+    def redraw(self):
+        """ Updates the console display, unless running headless. """
+        if not HEADLESS:
+            self.update_display()
+    def total_value(self):
+        return sum(client.get_account_value() for client in self.clients)
     def stop(self):
-        self.client.stop()
+        self.feed.stop()
+        for client in self.clients:
+            client.stop()
+        self.watchdog.stop()
         self.running = False
         print("Quitting. Cleaning up...")
+    async def watch_config(self):
+        """ Reloads config.py whenever it is saved, and applies the changes without restarting. """
+        last_modified = os.path.getmtime(config.__file__)
+        while self.running and CONFIG_RELOAD_INTERVAL > 0:
+            await self.clock.sleep(CONFIG_RELOAD_INTERVAL)
+            modified = os.path.getmtime(config.__file__)
+            if modified == last_modified:
+                continue
+            last_modified = modified
+            try:
+                changed = reload_config()
+            except Exception as e:
+                self.display_low_priority_feed.feedlines(f"config.py not reloaded, keeping the old settings: {e!r}")
+                continue
+            added, removed = await self.feed.apply_config()
+            for client in self.clients:
+                client.overrides = account_overrides(client.name)
+            self.display_low_priority_feed.feedlines(f"Reloaded config.py. Added: {added or 'none'}. Removed: {removed or 'none'}.")
+            if len(changed) > 0:
+                self.display_low_priority_feed.feedlines(f"Changes to {', '.join(changed)} take effect after a restart.")
     async def handle_input(self):
         while self.running:
             cmd = await ainput("")
-            cmd = cmd.casefold()
-            if cmd == "quit":
-                self.stop()
-            elif cmd == "":
-                self.update_display()
-            elif cmd == "breakpoint":
-                # pass 
+            if cmd.casefold() == "breakpoint":
                 breakpoint()
-            elif cmd == "test":
-                pass
-            elif cmd.startswith("buy") or cmd.startswith("sell"):
-                cmd  = cmd.split(' ')
-                def print_usage():
-                    self.display_low_priority_feed.feedlines(f"Usage: {cmd[0]} symbol [$0.00]")
-                    self.update_display()
-                if len(cmd) == 1:
-                    print_usage()
-                    continue
-                if cmd[0] == 'buy':
-                    side = Client.SIDE_BUY
-                elif cmd[0] == 'sell':
-                    side = Client.SIDE_SELL
-                symbol = cmd[1].upper()
-                if symbol not in SYMBOLS:
-                    self.display_low_priority_feed.feedlines(f"Symbol {symbol} not included in config.py")
-                    self.update_display()
-                    continue
-                if len(cmd) == 2:
-                    if side == Client.SIDE_BUY:
-                        self.client.buy_all(symbol)
-                    elif side == Client.SIDE_SELL:
-                        self.client.sell_all(symbol)
-                    continue
-                funds = None
-                size = None
-                if len(cmd) > 2:
-                    if cmd[2].startswith('$'):
-                        funds = float(cmd[2][1:])
-                    else:
-                        size = float(cmd[2])
+                continue
+            reply = await self.execute_command(cmd)
+            if reply is not None:
+                print(reply)
+    async def execute_command(self, cmd):
+        """ Carries out a command from the console or the control API. Returns a reply to show, or None. """
+        cmd = cmd.casefold().strip()
+        if cmd == "quit":
+            self.stop()
+        elif cmd == "":
+            self.redraw()
+        elif cmd == "status":
+            return self.status_line()
+        elif cmd == "test":
+            pass
+        elif cmd.startswith("account"):
+            cmd = cmd.split(' ')
+            names = [client.name for client in self.clients]
+            if len(cmd) > 1:
+                for client in self.clients:
+                    if client.name.casefold() == cmd[1]:
+                        self.client = client
+                        break
                 else:
-                    funds = TRANSACT_AMOUNT[symbol]
-                self.create_market_order(symbol, side, size=size, funds=funds)
+                    return f"No account named {cmd[1]}. Accounts: {', '.join(names)}"
+            return f"Commands act on account {self.client.name}. Accounts: {', '.join(names)}"
+        elif cmd == "latency":
+            return self.latency_report()
+        elif cmd.startswith("profile"):
+            cmd = cmd.split(' ')
+            try:
+                seconds = float(cmd[1]) if len(cmd) > 1 else 30
+            except ValueError:
+                return "Usage: profile [seconds]"
+            return self.start_profile(seconds)
+        elif cmd.startswith("buy") or cmd.startswith("sell"):
+            cmd  = cmd.split(' ')
+            def print_usage():
+                self.display_low_priority_feed.feedlines(f"Usage: {cmd[0]} symbol [$0.00]")
+                self.redraw()
+                return f"Usage: {cmd[0]} symbol [$0.00]"
+            if len(cmd) == 1:
+                return print_usage()
+            if cmd[0] == 'buy':
+                side = Client.SIDE_BUY
+            elif cmd[0] == 'sell':
+                side = Client.SIDE_SELL
             else:
-                print(f'{cmd} not yet implemented.')
+                return print_usage()
+            if PAPER_TRADING:
+                return "Paper trading is on, so no real orders are placed."
+            symbol = cmd[1].upper()
+            if symbol not in SYMBOLS:
+                self.display_low_priority_feed.feedlines(f"Symbol {symbol} not included in config.py")
+                self.redraw()
+                return f"Symbol {symbol} not included in config.py"
+            if len(cmd) == 2:
+                if side == Client.SIDE_BUY:
+                    await self.client.buy_all(symbol)
+                elif side == Client.SIDE_SELL:
+                    await self.client.sell_all(symbol)
+                return f"Placed {side} order for all of {symbol}"
+            funds = None
+            size = None
+            try:
+                if cmd[2].startswith('$'):
+                    funds = float(cmd[2][1:])
+                else:
+                    size = float(cmd[2])
+            except ValueError:
+                return print_usage()
+            o = await self.create_market_order(symbol, side, size=size, funds=funds)
+            return f"Market order: {o}"
+        else:
+            return f'{cmd} not yet implemented.'
+    def start_profile(self, seconds):
+        """ Samples the event loop for the given number of seconds, then writes the results to PROFILE_DIR. """
+        if self.profiler is not None:
+            return "A profile is already running."
+        self.profiler = SamplingProfiler(interval = PROFILE_SAMPLE_INTERVAL)
+        self.profiler.start()
+        def finish():
+            self.profiler.stop()
+            paths = self.profiler.dump(PROFILE_DIR)
+            self.display_low_priority_feed.feedlines(f"Profile of {self.profiler.samples} samples written to {' and '.join(paths)}")
+            self.profiler = None
+        asyncio.get_event_loop().call_later(seconds, finish)
+        return f"Profiling for {seconds} seconds..."
+    def latency_report(self):
+        """ Round trip times of the recent order requests of each account. """
+        lines = []
+        for client in self.clients:
+            if client.transport is None:
+                lines.append(f"{client.name}: orders are not sent through the order transport.")
+                continue
+            lines.append(f"{client.name}: server clock offset {client.transport.time_offset} ms")
+            for request, stats in client.transport.latency_summary().items():
+                lines.append(f"  {request}: {stats['count']} requests, last {stats['last']*1000:.1f} ms, " +
+                             f"median {stats['median']*1000:.1f} ms, max {stats['max']*1000:.1f} ms")
+        return '\n'.join(lines)
+    def status_line(self):
+        return f"Uptime: {datetime.timedelta(seconds = int(self.clock.time()-self.up_since))} | " + \
+               f"Total Value: ${round(self.total_value(), 5)} | " + \
+               f"Markets: {len(self.feed.market_data)} | " + \
+               f"Accounts: {len(self.clients)}"
+    def snapshot(self):
+        """ Returns the state of the bot as a dict of plain values, for the control API. """
+        def to_float(value):
+            return None if value is None else float(value)
+        def balances(client):
+            balances = dict()
+            for c, account in client.accounts.get('trade', {}).items():
+                if account['balance'] > 0:
+                    balances[c] = {
+                        'balance': account['balance'],
+                        'available': account['available'],
+                        'value': client.get_account_value(symbol = c),
+                    }
+            return balances
+        def positions(client):
+            return client.ledger.summary(self.feed.orderbook_data)
+        markets = dict()
+        for sym, md in self.feed.market_data.items():
+            fast_ma, slow_ma = md.get_last_ma(ma = WHICH_MA)
+            ma_crossover, _ = md.get_ma_crossover(ma = WHICH_MA, mark = False)
+            orderbook = self.feed.orderbook_data.get(sym, {})
+            markets[sym] = {
+                'bid': to_float(orderbook.get('bestBid')),
+                'ask': to_float(orderbook.get('bestAsk')),
+                'close': to_float(md.get_last_close()),
+                'fast_ma': fast_ma,
+                'slow_ma': slow_ma,
+                'crossover': ma_crossover,
+                'pending_crossover': md.get_pending_crossover(ma = WHICH_MA),
+                'live_ma': md.live_ma[WHICH_MA] if md.live is not None else None,
+            }
+        return {
+            'time': self.clock.time(),
+            'uptime': self.clock.time() - self.up_since,
+            'running': self.running,
+            'total_value': self.total_value(),
+            # Of the account commands act on
+            'balances': balances(self.client),
+            'positions': positions(self.client),
+            'accounts': {client.name: {'value': client.get_account_value(), 'balances': balances(client), 'positions': positions(client),
+                                       'latency': None if client.transport is None else client.transport.latency_summary()}
+                         for client in self.clients},
+            'markets': markets,
+            'paper': None if self.feed.paper is None else
+                     {name: {'value': value, 'profit': profit, 'fills': fills, 'fees': fees}
+                      for name, value, profit, fills, fees in self.feed.paper.results()},
+            'messages': [line for line in str(self.display_info_feed).split('\n') if line != ''],
+        }
+
+# Settings that are only read at start up
+RESTART_SETTINGS = ('SANDBOX', 'API_KEY', 'API_SECRET', 'API_PASSPHRASE', 'RECORD_SESSION', 'RECORDING_FILE',
+                    'PAPER_TRADING', 'PAPER_STARTING_FUNDS', 'PAPER_FEE_RATE', 'ACCOUNTS', 'LEDGER_FILE',
+                    'FAST_ORDERS', 'ORDER_TIMEOUT', 'ORDER_CLOCK_SYNC_INTERVAL', 'HEADLESS', 'CONTROL_API_PORT',
+                    'CONTROL_API_SOCKET', 'CONTROL_API_TOKEN', 'LOG_MAX_BYTES', 'LOG_BACKUP_COUNT',
+                    'LOOP_STALL_THRESHOLD', 'REST_REQUESTS_PER_SECOND', 'REFRESH_SETTLE_DELAY', 'REFRESH_JITTER')
+
+def default_settings():
+    """ The strategy settings of config.py, by the names paper strategies and accounts override them with. """
+    return {
+        'fast_ma_period': FAST_MA_PERIOD,
+        'slow_ma_period': SLOW_MA_PERIOD,
+        'which_ma': WHICH_MA,
+        'transact_amount': TRANSACT_AMOUNT,
+        'sell_to_buy_ratio': SELL_TO_BUY_RATIO,
+        'take_profit_percent': TAKE_PROFIT_PERCENT,
+    }
+
+def account_overrides(name):
+    """ The settings the account called name changes for itself in ACCOUNTS. The main account changes none.
+    These follow config.py as it is now, although the accounts themselves are only set up at start up. """
+    for account in config.ACCOUNTS:
+        if account['name'] == name:
+            return account
+    return dict()
+
+def reload_config():
+    """ Re-reads config.py and replaces the settings imported from it, except RESTART_SETTINGS, which keep the values
+    they were started with. Returns the names of those that were changed in the file. """
+    importlib.reload(config)
+    new = {name: value for name, value in vars(config).items() if not name.startswith('_')}
+    changed = [name for name in RESTART_SETTINGS if new.get(name) != globals().get(name)]
+    for name in RESTART_SETTINGS:
+        new.pop(name, None)
+    if 'SANDBOX' in changed:
+        # The markets come from the other half of the SANDBOX switch, so they wait for the restart too
+        new.pop('SYMBOLS', None)
+    globals().update(new)
+    return changed
 
 async def main():
     # Set up
 
-    client = KucoinClient(Client(api_key = API_KEY, api_secret = API_SECRET, passphrase = API_PASSPHRASE, sandbox = SANDBOX))
-    trader = Trader(client)
+    def order_transport(api_key, api_secret, passphrase):
+        if PAPER_TRADING or not FAST_ORDERS:
+            return None
+        return OrderTransport(api_key, api_secret, passphrase, sandbox = SANDBOX, timeout = ORDER_TIMEOUT)
+
+    client = Client(api_key = API_KEY, api_secret = API_SECRET, passphrase = API_PASSPHRASE, sandbox = SANDBOX)
+    recorder = None
+    if RECORD_SESSION:
+        recorder = Recorder(RECORDING_FILE)
+        client = RecordingClient(client, recorder)
+    client = KucoinClient(client, recorder = recorder, ledger_path = None if PAPER_TRADING else LEDGER_FILE.format(account = 'main'),
+                          transport = order_transport(API_KEY, API_SECRET, API_PASSPHRASE))
+    clients = [client]
+    if not PAPER_TRADING:
+        # Further accounts share the market data of the first. They aren't recorded, as a replay has one account
+        for account in ACCOUNTS:
+            account_client = Client(api_key = account['api_key'], api_secret = account['api_secret'],
+                                    passphrase = account['api_passphrase'], sandbox = SANDBOX)
+            clients.append(KucoinClient(account_client, feed = client.feed, name = account['name'], overrides = account,
+                                        ledger_path = LEDGER_FILE.format(account = account['name']),
+                                        transport = order_transport(account['api_key'], account['api_secret'], account['api_passphrase'])))
+    trader = Trader(*clients)
    
     # Main loop
     print("Starting KuCoin trading bot...")
-    await asyncio.gather(client.ainit(),
-                         trader.main_loop(),
-                         trader.handle_input())
+    tasks = [client.feed.ainit(), *[c.ainit() for c in clients], trader.main_loop(), trader.watch_config(), trader.watchdog.run()]
+    tasks += [c.transport.keep_time(ORDER_CLOCK_SYNC_INTERVAL) for c in clients if c.transport is not None]
+    if not HEADLESS:
+        tasks.append(trader.handle_input())
+    if CONTROL_API_PORT is not None or CONTROL_API_SOCKET is not None:
+        tasks.append(ControlServer(trader, CONTROL_API_TOKEN, port = CONTROL_API_PORT, path = CONTROL_API_SOCKET).serve())
+    elif HEADLESS:
+        print("Running headless without a control API. Stop the bot with ctrl+c.")
+    await asyncio.gather(*tasks)
 
     print("Goodbye :)")
     
@@ -0,0 +1,101 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+from collections import deque
+import json
+import logging
+import os
+
+from util import Trade, TradeStack
+
+# Number of recent trade ids remembered, so a fill delivered twice is only counted once
+RECENT_TRADES = 1000
+
+
+class Ledger:
+    """ The positions of an account, one TradeStack per symbol, updated from its fills.
+
+    If path is given, the ledger is loaded from it and saved back to it after every fill, so a restart (even after
+    a crash) picks up where it left off. """
+    def __init__(self, path: str = None):
+        self.path = path
+        # { symbol : TradeStack }
+        self.positions = dict()
+        self.recent_trades = deque()
+        self.recent_trade_ids = set()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def record_fill(self, symbol: str, side: str, size: float, price: float, trade_id: str = None):
+        """ Adds a fill to the position of symbol, and saves the ledger. Returns False if trade_id was already
+        recorded. """
+        if trade_id is not None:
+            if trade_id in self.recent_trade_ids:
+                return False
+            if len(self.recent_trades) >= RECENT_TRADES:
+                self.recent_trade_ids.discard(self.recent_trades.popleft())
+            self.recent_trades.append(trade_id)
+            self.recent_trade_ids.add(trade_id)
+        position = self.positions.get(symbol)
+        if position is None:
+            position = self.positions[symbol] = TradeStack()
+        position.push(Trade(side, size, price))
+        # Fills are few, and one lost can't be got back, so each is saved straight away
+        self.save()
+        return True
+
+    def summary(self, quotes: dict):
+        """ Returns { symbol : { 'quantity', 'average_cost', 'realized', 'unrealized' } }, valuing what is held
+        at the best bid in quotes (unrealized is None for symbols without a quote). """
+        summary = dict()
+        for symbol, position in self.positions.items():
+            quote = quotes.get(symbol)
+            summary[symbol] = {
+                'quantity': position.quantity,
+                'average_cost': position.get_average_cost(),
+                'realized': position.realized_pnl,
+                'unrealized': None if quote is None else position.get_unrealized_pnl(float(quote['bestBid'])),
+            }
+        return summary
+
+    def to_dict(self):
+        return {
+            'positions': {symbol: {'lots': list(p.lots), 'realized_pnl': p.realized_pnl, 'untracked': p.untracked}
+                          for symbol, p in self.positions.items()},
+            'recent_trades': list(self.recent_trades),
+        }
+    def from_dict(self, state: dict):
+        self.positions = dict()
+        for symbol, saved in state['positions'].items():
+            position = TradeStack()
+            for quantity, price in saved['lots']:
+                position.push(Trade('buy', quantity, price))
+            position.realized_pnl = saved['realized_pnl']
+            position.untracked = saved['untracked']
+            self.positions[symbol] = position
+        self.recent_trades = deque(state['recent_trades'][-RECENT_TRADES:])
+        self.recent_trade_ids = set(self.recent_trades)
+
+    def load(self):
+        with open(self.path) as f:
+            self.from_dict(json.load(f))
+        logging.info(f" Ledger loaded from {self.path}: {len(self.positions)} positions.")
+    def save(self):
+        """ Writes the ledger to self.path. The old file is only replaced once the new one is complete, so a crash
+        while saving never leaves a damaged ledger behind. """
+        if self.path is None:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
@@ -0,0 +1,263 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" Paper trading: many strategy variants trading simulated accounts, all driven by the live market data.
+
+Every strategy follows the same rules as the live bot (buy on a bullish crossover and place a take profit order, sell
+on a bearish one), with its own settings. The moving averages are computed once per market for all strategies
+whenever a candle closes, and orders are filled against the latest ticker of the market.
+"""
+
+from collections import defaultdict
+import logging
+
+import numpy as np
+
+from indicators import ema_seeded, sma
+from util import lookup_setting
+
+
+class PaperAccount:
+    """ Simulated balances and orders. Market orders fill at the best bid or ask, limit orders fill at their price
+    once the market reaches it. A fee of fee_rate times the value of each fill is paid in the quote currency. """
+    def __init__(self, funds: float, fee_rate: float = 0.001, currency: str = 'USDT'):
+        self.starting_funds = funds
+        self.fee_rate = fee_rate
+        self.currency = currency
+        self.balances = defaultdict(float)
+        self.balances[currency] = funds
+        # Amounts held by open orders, by currency
+        self.holds = defaultdict(float)
+        # { symbol : [ {'side', 'price', 'size'}, ... ] }
+        self.orders = defaultdict(list)
+        self.fills = 0
+        self.fees = 0.0
+
+    def available(self, currency):
+        return self.balances[currency] - self.holds[currency]
+
+    def market_order(self, symbol, side, quote, size = None, funds = None):
+        """ Fills as much of the order as the balances allow. Returns (price, size) of the fill, or None. """
+        base, currency = symbol.split('-')
+        if side == 'buy':
+            price = quote['bestAsk']
+            if size is None:
+                size = funds / price
+            size = min(size, self.available(currency) / (price*(1 + self.fee_rate)))
+        else:
+            price = quote['bestBid']
+            if size is None:
+                size = funds / price
+            size = min(size, self.available(base))
+        if size <= 0 or price <= 0:
+            return None
+        self._fill(symbol, side, price, size)
+        return price, size
+
+    def limit_order(self, symbol, side, price, size):
+        base, currency = symbol.split('-')
+        if side == 'buy':
+            size = min(size, self.available(currency) / (price*(1 + self.fee_rate)))
+            self.holds[currency] += size*price*(1 + self.fee_rate)
+        else:
+            size = min(size, self.available(base))
+            self.holds[base] += size
+        if size > 0:
+            self.orders[symbol].append({'side': side, 'price': price, 'size': size})
+
+    def cancel_all(self, symbol):
+        base, currency = symbol.split('-')
+        for order in self.orders.pop(symbol, []):
+            self._release(base, currency, order)
+
+    def match(self, symbol, quote):
+        """ Fills the open orders of symbol that the quote has reached. Returns the fills as (side, price, size). """
+        orders = self.orders.get(symbol)
+        if not orders:
+            return []
+        base, currency = symbol.split('-')
+        filled = []
+        remaining = []
+        for order in orders:
+            if (order['side'] == 'sell' and quote['bestBid'] >= order['price']) or \
+               (order['side'] == 'buy' and quote['bestAsk'] <= order['price']):
+                self._release(base, currency, order)
+                self._fill(symbol, order['side'], order['price'], order['size'])
+                filled.append((order['side'], order['price'], order['size']))
+            else:
+                remaining.append(order)
+        self.orders[symbol] = remaining
+        return filled
+
+    def value(self, quotes):
+        """ Value of the account in the quote currency, selling everything at the best bid. """
+        value = self.balances[self.currency]
+        for c, balance in self.balances.items():
+            if c != self.currency and balance != 0:
+                quote = quotes.get(f"{c}-{self.currency}")
+                if quote is not None:
+                    value += balance*quote['bestBid']
+        return value
+
+    def _fill(self, symbol, side, price, size):
+        base, currency = symbol.split('-')
+        fee = price*size*self.fee_rate
+        sign = 1 if side == 'buy' else -1
+        self.balances[base] += sign*size
+        self.balances[currency] -= sign*price*size + fee
+        self.fees += fee
+        self.fills += 1
+    def _release(self, base, currency, order):
+        if order['side'] == 'buy':
+            self.holds[currency] -= order['size']*order['price']*(1 + self.fee_rate)
+        else:
+            self.holds[base] -= order['size']
+
+
+class PaperStrategy:
+    """ One variant of the strategy, with the settings it overrides and its own account. """
+    def __init__(self, name: str, overrides: dict, account: PaperAccount):
+        self.name = name
+        self.overrides = overrides
+        self.account = account
+
+    def setting(self, key, symbol, defaults):
+        return lookup_setting(self.overrides, key, symbol, defaults)
+
+
+class PaperBook:
+    """ Runs every strategy in strategies (a list of dicts, see PAPER_STRATEGIES in config.py) on the given markets.
+
+    market_data and quotes are the dicts of MarketData and of the latest ticker of each symbol, as kept by the client.
+    defaults holds the settings of the live bot, used for anything a strategy doesn't override. """
+    def __init__(self, market_data: dict, quotes: dict, strategies: list, defaults: dict,
+                 funds: float = 1000, fee_rate: float = 0.001):
+        self.market_data = market_data
+        self.quotes = quotes
+        self.funds = funds
+        self.fee_rate = fee_rate
+        self.strategies = []
+        # Store the timestamp of the last candle evaluated for each symbol
+        self.last_eval_time = defaultdict(int)
+        # { (symbol, period) : (candle time, previous EMA, latest EMA) } of the EMAs MarketData doesn't keep
+        self.ema_state = dict()
+        self.configure(strategies, defaults)
+
+    def configure(self, strategies: list, defaults: dict):
+        """ Applies a new list of strategies. Strategies that keep their name keep their account. """
+        accounts = {s.name: s.account for s in self.strategies}
+        self.defaults = defaults
+        self.strategies = [PaperStrategy(s['name'], s, accounts.get(s['name']) or PaperAccount(self.funds, self.fee_rate))
+                           for s in strategies]
+
+    def history_needed(self, symbol):
+        """ Number of candles of symbol the strategies need to compute their moving averages. """
+        periods = [s.setting(key, symbol, self.defaults) for s in self.strategies for key in ('fast_ma_period', 'slow_ma_period')]
+        return 4*max(periods, default=0)
+
+    def on_ticker(self, symbol):
+        quote = self.quotes[symbol]
+        for strategy in self.strategies:
+            for side, price, size in strategy.account.match(symbol, quote):
+                logging.info(f" Paper {strategy.name}: filled limit {side} {symbol} {size} at {price}.")
+
+    def evaluate(self):
+        """ Trades every strategy on the markets whose candle closed since the last call. """
+        for sym, md in self.market_data.items():
+            last_time = md._last_time()
+            if last_time is None or last_time <= self.last_eval_time[sym]:
+                continue
+            quote = self.quotes.get(sym)
+            if quote is None:
+                # Evaluated once the first ticker arrives
+                continue
+            self.last_eval_time[sym] = last_time
+            averages = self._averages(sym, md)
+            for strategy in self.strategies:
+                which_ma = strategy.setting('which_ma', sym, self.defaults).upper()
+                last_fast, this_fast = averages[which_ma, strategy.setting('fast_ma_period', sym, self.defaults)]
+                last_slow, this_slow = averages[which_ma, strategy.setting('slow_ma_period', sym, self.defaults)]
+                # NaN comparisons are False, so markets without enough history never signal
+                if last_fast <= last_slow and this_fast > this_slow:
+                    self._buy(strategy, sym, quote)
+                elif last_fast >= last_slow and this_fast < this_slow:
+                    self._sell(strategy, sym, quote)
+
+    def _averages(self, symbol, md):
+        """ Returns { (ma, period) : (previous value, latest value) } for every average any strategy uses on symbol.
+        Each distinct period is computed once, however many strategies share it. """
+        needed = defaultdict(set)
+        for s in self.strategies:
+            which_ma = s.setting('which_ma', symbol, self.defaults).upper()
+            needed[which_ma].add(s.setting('fast_ma_period', symbol, self.defaults))
+            needed[which_ma].add(s.setting('slow_ma_period', symbol, self.defaults))
+        periods = np.array(sorted(needed['SMA'] | needed['EMA']))
+        closes = md.get_closes()
+        if len(closes) < 2:
+            return defaultdict(lambda: (np.nan, np.nan))
+        rows = np.tile(closes, (len(periods), 1))
+        smas = sma(rows, periods)
+        averages = dict()
+        for i, period in enumerate(periods):
+            averages['SMA', period] = (smas[i, -2], smas[i, -1])
+            if period in needed['EMA']:
+                averages['EMA', period] = self._ema(symbol, md, period, closes, smas[i])
+        return averages
+
+    def _ema(self, symbol, md, period, closes, smas):
+        """ Returns (previous, latest) EMA of period on symbol. Like MarketData's own, it is seeded from the SMA the first
+        time it is needed and then carried forward from candle to candle, so that dropping old candles doesn't change it. """
+        if period in md.ma_periods and len(md.data[1]) > 8:
+            # The same EMA as the live bot's
+            idx = md.ma_periods.index(period)
+            prev, this = md.data[1][8][idx], md.data[0][8][idx]
+            return (np.nan if prev is None else prev), (np.nan if this is None else this)
+        last_time = md._last_time()
+        state = self.ema_state.get((symbol, period))
+        new = 0 if state is None else (last_time - state[0]) // md.window_seconds
+        if state is None or np.isnan(state[2]) or not 0 <= new < len(closes):
+            emas = ema_seeded(closes, period, smas)
+            state = (last_time, emas[-2], emas[-1])
+        else:
+            alpha = 2/(1 + period)
+            _, prev, this = state
+            for close in closes[len(closes) - new:]:
+                prev, this = this, alpha*close + (1 - alpha)*this
+            state = (last_time, prev, this)
+        self.ema_state[symbol, period] = state
+        return state[1], state[2]
+
+    def _buy(self, strategy, symbol, quote):
+        account = strategy.account
+        fill = account.market_order(symbol, 'buy', quote, funds = strategy.setting('transact_amount', symbol, self.defaults))
+        if fill is None:
+            return
+        logging.info(f" Paper {strategy.name}: bought {symbol} {fill[1]} at {fill[0]}.")
+        # Like the live bot, replace the take profit order with one for the whole balance
+        account.cancel_all(symbol)
+        price = quote['price']*(100 + strategy.setting('take_profit_percent', symbol, self.defaults))/100
+        account.limit_order(symbol, 'sell', price, account.available(symbol.split('-')[0]))
+
+    def _sell(self, strategy, symbol, quote):
+        account = strategy.account
+        account.cancel_all(symbol)
+        funds = strategy.setting('sell_to_buy_ratio', symbol, self.defaults)*strategy.setting('transact_amount', symbol, self.defaults)
+        fill = account.market_order(symbol, 'sell', quote, funds = funds)
+        if fill is not None:
+            logging.info(f" Paper {strategy.name}: sold {symbol} {fill[1]} at {fill[0]}.")
+
+    def results(self):
+        """ Returns a list of (name, value, profit, fills, fees) for every strategy. """
+        results = []
+        for s in self.strategies:
+            value = s.account.value(self.quotes)
+            results.append((s.name, value, value - s.account.starting_funds, s.account.fills, s.account.fees))
+        return results
@@ -0,0 +1,173 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" Tools for finding out where the event loop spends its time.
+
+SamplingProfiler periodically samples the stack of one thread from a background thread, so the profiled code runs at
+full speed. Results are written as a pstats file (open with python -m pstats, or snakeviz) and as collapsed stacks
+(one "frame;frame;frame count" line per stack, the input format of flamegraph.pl and speedscope).
+
+LoopWatchdog reports, with a stack trace, whenever a callback holds the event loop for longer than a threshold.
+"""
+
+import asyncio
+from collections import Counter, defaultdict
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+import traceback
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+def _stack_keys(frame):
+    """ Returns the stack of frame as function keys, outermost first. """
+    keys = []
+    while frame is not None:
+        keys.append(_frame_key(frame))
+        frame = frame.f_back
+    keys.reverse()
+    return tuple(keys)
+
+
+class SamplingProfiler:
+    """ Samples the stack of a thread (by default the calling thread) every interval seconds, until stopped. """
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        # { stack : seconds spent in it }
+        self.stacks = Counter()
+        # { stack : number of samples of it }
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                # Weight each sample by the time since the previous one, in case sampling fell behind
+                stack = _stack_keys(frame)
+                self.stacks[stack] += now - last
+                self.counts[stack] += 1
+                self.samples += 1
+            del frame
+            last = now
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w') as f:
+            for stack, seconds in self.stacks.items():
+                frames = ';'.join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+                # Counts are in microseconds, since flame graph tools expect integers
+                f.write(f"{frames} {max(1, int(seconds*1e6))}\n")
+
+    def write_pstats(self, path: str):
+        """ Writes the samples in the format of cProfile, so they can be loaded with pstats.Stats(path).
+        Call counts are sample counts, since a sampling profiler can't see individual calls. """
+        total_time = defaultdict(float)
+        own_time = defaultdict(float)
+        hits = Counter()
+        # { callee : { caller : [hits, seconds] } }
+        callers = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+        for stack, seconds in self.stacks.items():
+            count = self.counts[stack]
+            own_time[stack[-1]] += seconds
+            # Recursive functions only count once per sample towards their total time
+            for func in set(stack):
+                total_time[func] += seconds
+                hits[func] += count
+            for caller, callee in zip(stack, stack[1:]):
+                edge = callers[callee][caller]
+                edge[0] += count
+                edge[1] += seconds
+        stats = dict()
+        for func in total_time:
+            func_callers = {caller: (n, n, seconds, seconds) for caller, (n, seconds) in callers[func].items()}
+            stats[func] = (hits[func], hits[func], own_time[func], total_time[func], func_callers)
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def dump(self, directory: str = '.', prefix: str = 'profile'):
+        """ Writes the pstats and collapsed stack files. Returns their paths. """
+        name = os.path.join(directory, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}")
+        self.write_pstats(name + '.pstats')
+        self.write_collapsed(name + '.folded')
+        return name + '.pstats', name + '.folded'
+
+
+class LoopWatchdog:
+    """ Reports whenever the event loop is blocked for longer than threshold seconds.
+
+    A heartbeat task on the loop records the time every threshold/4 seconds, and a background thread checks that it
+    keeps doing so. When it stops, the thread captures the stack of the loop while it is still blocked, so the
+    report points at the offending code. report is called on the loop (once it is free again) with each message. """
+    def __init__(self, threshold: float, report = None):
+        self.threshold = threshold
+        self.report = report
+        self.running = False
+        self.last_beat = time.monotonic()
+        self.beats = 0
+        self.stalls = 0
+
+    async def run(self):
+        """ Runs the heartbeat until stop() is called. """
+        if self.threshold <= 0:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.running = True
+        threading.Thread(target=self._watch, name="LoopWatchdog", daemon=True).start()
+        while self.running:
+            self.last_beat = time.monotonic()
+            self.beats += 1
+            await asyncio.sleep(self.threshold/4)
+    def stop(self):
+        self.running = False
+
+    def _watch(self):
+        reported_beat = None
+        stall_start = None
+        while self.running:
+            time.sleep(self.threshold/4)
+            beat, age = self.beats, time.monotonic() - self.last_beat
+            if age > self.threshold and beat != reported_beat:
+                reported_beat = beat
+                stall_start = self.last_beat
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+                del frame
+                self.stalls += 1
+                self._report(f"Event loop blocked for over {age:.2f}s. Stack of the loop:\n{stack}")
+            elif stall_start is not None and beat != reported_beat:
+                self._report(f"Event loop was blocked for {self.last_beat - stall_start - self.threshold/4:.2f}s in total.")
+                stall_start = None
+
+    def _report(self, message):
+        logging.warning(f" {message}")
+        if self.report is not None:
+            # Only the first line goes to the display; the stack is in the log
+            self.loop.call_soon_threadsafe(self.report, message.split('\n')[0])
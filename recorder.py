@@ -0,0 +1,197 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" Recording and replaying of the traffic the bot sees.
+
+A recording is a gzip compressed sequence of records. Each record is a header (timestamp as a double, record kind as
+a byte, payload length as an unsigned int, all little endian) followed by the payload as compact JSON.
+"""
+
+import asyncio
+from collections import defaultdict, deque
+import gzip
+import json
+import logging
+import struct
+import zlib
+
+from clock import SYSTEM_CLOCK, VirtualClock
+
+RECORD_HEADER = struct.Struct('<dBI')
+# Record kinds
+WS_MESSAGE = 1
+REST_RESPONSE = 2
+
+# Returned by the replay client for calls that have no recorded response left
+EMPTY_RESPONSES = {
+    'get_kline_data': [],
+    'get_orders': {'items': []},
+}
+
+
+class Recorder:
+    """ Appends every inbound websocket message and REST response to a recording. """
+    def __init__(self, path: str, clock = SYSTEM_CLOCK, flush_interval: float = 5):
+        self.path = path
+        self.clock = clock
+        self.flush_interval = flush_interval
+        # Low compression level keeps the cost per message small; recordings still shrink several times over
+        self.file = gzip.open(path, 'ab', compresslevel=1)
+
+    def write(self, kind: int, payload):
+        if self.file.closed:
+            return
+        self.write_bytes(kind, json.dumps(payload, separators=(',', ':'), default=str).encode())
+    def write_bytes(self, kind: int, data: bytes):
+        if self.file.closed:
+            return
+        self.file.write(RECORD_HEADER.pack(self.clock.time(), kind, len(data)) + data)
+    def record_raw_message(self, raw):
+        """ Records a websocket message as received, which saves encoding it again. """
+        self.write_bytes(WS_MESSAGE, raw.encode() if isinstance(raw, str) else raw)
+    def record_response(self, method: str, args, kwargs, result, error: str = None):
+        self.write(REST_RESPONSE, {'method': method, 'args': args, 'kwargs': kwargs, 'result': result, 'error': error})
+
+    async def auto_flush(self):
+        while not self.file.closed:
+            await self.clock.sleep(self.flush_interval)
+            self.flush()
+    def flush(self):
+        if not self.file.closed:
+            self.file.flush()
+    def close(self):
+        self.file.close()
+
+class RecordingClient:
+    """ Wraps a kucoin Client and records the response of every call made through it. Coroutine methods (such as
+    those of an OrderTransport) are recorded once they have been awaited. """
+    def __init__(self, client, recorder: Recorder):
+        self.client = client
+        self.recorder = recorder
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        if asyncio.iscoroutinefunction(attr):
+            async def recorded_coroutine(*args, **kwargs):
+                try:
+                    result = await attr(*args, **kwargs)
+                except Exception as e:
+                    self.recorder.record_response(name, args, kwargs, None, error=str(e))
+                    raise
+                self.recorder.record_response(name, args, kwargs, result)
+                return result
+            return recorded_coroutine
+        def recorded_call(*args, **kwargs):
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self.recorder.record_response(name, args, kwargs, None, error=str(e))
+                raise
+            self.recorder.record_response(name, args, kwargs, result)
+            return result
+        return recorded_call
+
+
+def read_records(path: str):
+    """ Yields (timestamp, kind, payload) for every record in a recording.
+    A recording cut short (for example by a crash) is read up to its last complete record. """
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                t, kind, length = RECORD_HEADER.unpack(header)
+                data = f.read(length)
+            except (EOFError, zlib.error):
+                logging.info(f" Recording {path} ends with an incomplete record.")
+                return
+            if len(data) < length:
+                return
+            yield t, kind, json.loads(data)
+
+def _response_key(method, args):
+    """ Responses are replayed in order per method, and per symbol for calls that take one first. """
+    if len(args) > 0 and isinstance(args[0], str):
+        return method, args[0]
+    return method, None
+
+class ReplayClient:
+    """ Stands in for a kucoin Client, answering each call with the next response recorded for it. """
+    def __init__(self, responses):
+        # { (method, symbol) : deque([index, ...]) }
+        self.queues = defaultdict(deque)
+        self.responses = responses
+        self.consumed = set()
+        for index, response in enumerate(responses):
+            self.queues[_response_key(response['method'], response['args'])].append(index)
+    def __getattr__(self, name):
+        def replayed_call(*args, **kwargs):
+            queue = self.queues[_response_key(name, args)]
+            while len(queue) > 0 and queue[0] in self.consumed:
+                queue.popleft()
+            if len(queue) == 0:
+                logging.info(f" Replay: no recorded response left for {name}{args}.")
+                return EMPTY_RESPONSES.get(name)
+            index = queue.popleft()
+            self.consumed.add(index)
+            return self.responses[index]['result']
+        return replayed_call
+
+class Replayer:
+    """ Feeds a recording back through the bot on a virtual clock.
+
+    speed -- 1 replays in real time, N replays N times faster, and float('Inf') replays as fast as possible.
+    Websocket messages are passed to the handler given to run(). REST responses are handed out by self.client
+    when the bot makes the same call; responses that the bot has not asked for by the time they were recorded
+    are passed to on_response(method, args, kwargs, result, recorded_time) instead, so that periodic data such as
+    klines can be fed in directly. """
+    def __init__(self, path: str, speed: float = 1):
+        self.speed = speed
+        self.records = list(read_records(path))
+        start = self.records[0][0] if len(self.records) > 0 else 0
+        self.clock = VirtualClock(start)
+        self.responses = []
+        # Timeline of (timestamp, kind, message or response index)
+        self.timeline = []
+        for t, kind, payload in self.records:
+            if kind == REST_RESPONSE:
+                self.timeline.append((t, kind, len(self.responses)))
+                self.responses.append(payload)
+            else:
+                self.timeline.append((t, kind, payload))
+        self.client = ReplayClient(self.responses)
+
+    async def run(self, handler, on_response = None):
+        for t, kind, item in self.timeline:
+            await self._advance(t)
+            if kind == WS_MESSAGE:
+                await handler(item)
+            elif item not in self.client.consumed:
+                self.client.consumed.add(item)
+                response = self.responses[item]
+                if on_response is not None and response['error'] is None:
+                    on_response(response['method'], response['args'], response['kwargs'], response['result'], t)
+        await asyncio.sleep(0)
+
+    async def _advance(self, t):
+        """ Moves the virtual clock to t, waking sleepers on the way and pacing the replay to self.speed. """
+        while True:
+            wake = self.clock.next_wake_time()
+            step = t if wake is None or wake > t else wake
+            if self.speed != float('Inf'):
+                await asyncio.sleep(max(0, step - self.clock.time()) / self.speed)
+            self.clock.advance_to(step)
+            # Let the woken coroutines run before moving on
+            await asyncio.sleep(0)
+            if step >= t:
+                return
@@ -0,0 +1,50 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+# Plays back a session recorded with RECORD_SESSION = True in config.py, without connecting to KuCoin.
+# Usage:
+#   python replay.py session.rec.gz             (real time)
+#   python replay.py session.rec.gz --speed 10  (10 times faster)
+#   python replay.py session.rec.gz --max       (as fast as possible)
+# Orders the bot places during a replay are answered with the recorded responses, and never reach the exchange.
+
+import argparse
+import asyncio
+
+from kutrader import KucoinClient, Trader
+from recorder import Replayer
+
+
+async def replay(path: str, speed: float):
+    replayer = Replayer(path, speed = speed)
+    client = KucoinClient(replayer.client, clock = replayer.clock)
+    trader = Trader(client)
+
+    def on_response(method, args, kwargs, result, recorded_time):
+        # Kline polls happened on their own schedule, so feed them to the market data as they were recorded.
+        # Like a live update, only the candles that had closed by then are used.
+        if method == 'get_kline_data' and args[0] in client.market_data:
+            md = client.market_data[args[0]]
+            md._feed_data(md._closed_only(result, recorded_time))
+
+    main_loop = asyncio.create_task(trader.main_loop())
+    await replayer.run(client.handle_evt, on_response)
+    trader.running = False
+    main_loop.cancel()
+    print("Replay finished.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Replay a recorded trading session.")
+    parser.add_argument('recording')
+    parser.add_argument('--speed', type = float, default = 1, help = "replay speed, as a multiple of real time")
+    parser.add_argument('--max', action = 'store_true', help = "replay as fast as possible")
+    args = parser.parse_args()
+    asyncio.run(replay(args.recording, float('Inf') if args.max else args.speed))
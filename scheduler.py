@@ -0,0 +1,114 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+import logging
+import random
+
+from clock import SYSTEM_CLOCK
+
+# Longest time the scheduler sleeps, so that markets added while it sleeps are picked up quickly
+MAX_IDLE_TIME = 1
+
+
+class RefreshScheduler:
+    """ Refreshes the candles of every market from a single task.
+
+    Each market is refreshed shortly after its next candle closes: settle_delay seconds after the boundary, plus a
+    random delay of up to jitter seconds so that markets sharing a window don't all hit the kline endpoint at once.
+    All refreshes share a budget of requests_per_second REST requests, and when several markets are due, the ones
+    whose moving averages are closest to crossing go first.
+    market_data is the dict of MarketData to refresh. It is read on every pass, so markets may be added and removed. """
+    def __init__(self, market_data: dict, clock = SYSTEM_CLOCK, requests_per_second: float = 5,
+                 settle_delay: float = 2, jitter: float = 3, ma: str = 'SMA'):
+        self.market_data = market_data
+        self.clock = clock
+        self.requests_per_second = requests_per_second
+        self.settle_delay = settle_delay
+        self.jitter = jitter
+        self.ma = ma
+        # { symbol : time the market should next be refreshed }
+        self.due = dict()
+        # Token bucket for the request budget. It holds up to a second's worth of requests.
+        self.tokens = requests_per_second
+        self.last_refill = clock.time()
+        self.running = False
+
+    def plan(self, md, now):
+        """ Returns the time at which md should next be refreshed. """
+        if md.needs_update(now):
+            return now
+        next_boundary = (now // md.window_seconds + 1) * md.window_seconds
+        return next_boundary + self.settle_delay + random.uniform(0, self.jitter)
+
+    def reschedule(self, symbol):
+        """ Forgets the plan for symbol, for example because its MarketData was replaced. """
+        self.due.pop(symbol, None)
+
+    def crossover_distance(self, symbol):
+        """ How far apart the fast and slow moving averages are, relative to the price. """
+        md = self.market_data[symbol]
+        fast, slow = md.get_last_ma(ma = self.ma)
+        close = md.get_last_close()
+        if fast is None or slow is None or close is None:
+            # Markets without averages yet are refreshed first
+            return 0
+        return abs(fast - slow) / float(close)
+
+    async def acquire(self, requests = 1):
+        """ Waits until the budget allows another request. """
+        while True:
+            now = self.clock.time()
+            self.tokens = min(self.requests_per_second, self.tokens + (now - self.last_refill)*self.requests_per_second)
+            self.last_refill = now
+            if self.tokens >= requests:
+                self.tokens -= requests
+                return
+            await self.clock.sleep((requests - self.tokens) / self.requests_per_second)
+
+    async def run(self):
+        self.running = True
+        while self.running:
+            now = self.clock.time()
+            for sym in list(self.due):
+                if sym not in self.market_data:
+                    del self.due[sym]
+            for sym, md in self.market_data.items():
+                if sym not in self.due:
+                    self.due[sym] = self.plan(md, now)
+
+            ready = [sym for sym, t in self.due.items() if t <= now]
+            if len(ready) == 0:
+                await self.clock.sleep(min(MAX_IDLE_TIME, min(self.due.values(), default=now + MAX_IDLE_TIME) - now))
+                continue
+            ready.sort(key = self.crossover_distance)
+            for sym in ready:
+                await self.acquire()
+                if not self.running:
+                    return
+                md = self.market_data.get(sym)
+                if md is None:
+                    continue
+                requests_before = md.requests_made
+                try:
+                    md.update()
+                except Exception as e:
+                    logging.info(f" Refreshing {sym} failed: {e!r}")
+                # An update may take more than one request; charge the rest to the budget
+                self.tokens -= max(0, md.requests_made - requests_before - 1)
+                now = self.clock.time()
+                if md.needs_update(now):
+                    # The exchange didn't have the new candle yet, so try again shortly
+                    self.due[sym] = now + self.settle_delay
+                else:
+                    self.due[sym] = self.plan(md, now)
+
+    def stop(self):
+        self.running = False
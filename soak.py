@@ -0,0 +1,278 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+# Endurance test: runs the bot for weeks of simulated time against synthetic markets, in minutes of real time,
+# and fails if memory use, object counts or event loop lag keep growing.
+# Usage: python soak.py [--weeks 2] [--symbols 10]
+# Nothing is sent to KuCoin. Log files are written to a temporary folder (or --workdir).
+
+import argparse
+import asyncio
+import contextlib
+from collections import deque
+import gc
+import itertools
+import math
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from clock import VirtualClock
+
+
+def rss_bytes():
+    """ Current resident memory of this process. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Not Linux, so fall back on the peak, which still shows growth
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak*1024
+
+
+class SyntheticExchange:
+    """ Stands in for the KuCoin REST client. Prices follow fixed curves over time, so markets trend, reverse and
+    cross their moving averages regularly. Orders fill immediately (market) or when the price reaches them (limit),
+    and the resulting websocket messages are queued in self.messages. """
+    def __init__(self, symbols, clock, seed: int = 0):
+        self.symbols = symbols
+        self.clock = clock
+        rng = random.Random(seed)
+        # { symbol : (base price, [(amplitude, period in seconds, phase), ...]) }
+        self.curves = {sym: (rng.uniform(50, 500), [(rng.uniform(0.01, 0.05), rng.uniform(1800, 4*3600), rng.uniform(0, 2*math.pi)),
+                                                    (rng.uniform(0.001, 0.01), rng.uniform(120, 900), rng.uniform(0, 2*math.pi))])
+                       for sym in symbols}
+        self.balances = {'USDT': 10000.0}
+        self.holds = {'USDT': 0.0}
+        for sym in symbols:
+            self.balances[sym.split('-')[0]] = 0.0
+            self.holds[sym.split('-')[0]] = 0.0
+        # { order id : order }
+        self.orders = dict()
+        self.messages = deque()
+        self.ids = itertools.count()
+
+    def price(self, symbol, t):
+        base, waves = self.curves[symbol]
+        return base*(1 + sum(a*math.sin(2*math.pi*t/p + phase) for a, p, phase in waves))
+
+    # REST methods used by the bot
+    def get_accounts(self):
+        return [{'type': 'trade', 'currency': c, 'balance': str(b), 'available': str(b - self.holds[c]), 'holds': str(self.holds[c]), 'id': c}
+                for c, b in self.balances.items()]
+    def get_currencies(self):
+        return [{'currency': c, 'precision': 8} for c in self.balances]
+    def get_symbols(self):
+        return [{'symbol': sym, 'priceIncrement': '0.0001', 'baseMinSize': '0.0001', 'baseMaxSize': '10000000',
+                 'baseIncrement': '0.0001', 'quoteMinSize': '0.1', 'quoteMaxSize': '99999999', 'quoteIncrement': '0.01'}
+                for sym in self.symbols]
+    def get_kline_data(self, symbol, kline_type = '1min', start = None, end = None):
+        window = {'1min': 60, '3min': 180, '5min': 300, '15min': 900, '30min': 1800, '1hour': 3600}[kline_type]
+        now = self.clock.time()
+        if start is None:
+            start = now - 1500*window
+        candles = []
+        t = int(now // window * window)
+        while t >= start:
+            close = self.price(symbol, min(now, t + window))
+            candles.append([str(t), str(self.price(symbol, t)), str(close), str(close), str(close), '1', str(close)])
+            t -= window
+        return candles
+    def create_market_order(self, symbol, side, size = None, funds = None, client_oid = None, remark = None, stp = None):
+        price = self.price(symbol, self.clock.time())
+        if size is None:
+            size = funds / price
+        base, quote = symbol.split('-')
+        if side == 'buy':
+            size = min(size, (self.balances[quote] - self.holds[quote]) / price)
+        else:
+            size = min(size, self.balances[base] - self.holds[base])
+        oid = str(next(self.ids))
+        if size > 0:
+            self._fill(oid, symbol, side, 'market', price, size)
+        return {'orderId': oid}
+    def create_limit_order(self, symbol, side, price, size, client_oid = None, remark = None, time_in_force = None, stop = None,
+                           stop_price = None, stp = None, trade_type = None, cancel_after = None, post_only = None,
+                           hidden = None, iceberg = None, visible_size = None):
+        base = symbol.split('-')[0]
+        size = min(float(size), self.balances[base] - self.holds[base])
+        oid = str(next(self.ids))
+        self.orders[oid] = {'id': oid, 'symbol': symbol, 'side': side, 'price': float(price), 'size': size}
+        self.holds[base] += size
+        self._balance_changed(base)
+        return {'orderId': oid}
+    def get_orders(self, symbol = None, status = None, **kwargs):
+        return {'items': [o for o in self.orders.values() if symbol is None or o['symbol'] == symbol]}
+    def cancel_order(self, order_id):
+        order = self.orders.pop(order_id)
+        base = order['symbol'].split('-')[0]
+        self.holds[base] -= order['size']
+        self._balance_changed(base)
+        return {'cancelledOrderIds': [order_id]}
+    def cancel_all_orders(self, symbol = None):
+        oids = [o['id'] for o in self.get_orders(symbol)['items']]
+        for oid in oids:
+            self.cancel_order(oid)
+        return {'cancelledOrderIds': oids}
+
+    # Market simulation
+    def ticker(self, symbol):
+        price = self.price(symbol, self.clock.time())
+        return {'type': 'message', 'topic': f'/market/ticker:{symbol}', 'subject': 'trade.ticker',
+                'data': {'sequence': '0', 'price': str(price), 'size': '1', 'bestBid': str(price*0.9995), 'bestBidSize': '1',
+                         'bestAsk': str(price*1.0005), 'bestAskSize': '1'}}
+    def match_limit_orders(self):
+        for oid, order in list(self.orders.items()):
+            price = self.price(order['symbol'], self.clock.time())
+            if order['side'] == 'sell' and price >= order['price']:
+                del self.orders[oid]
+                self.holds[order['symbol'].split('-')[0]] -= order['size']
+                self._fill(oid, order['symbol'], 'sell', 'limit', order['price'], order['size'])
+    def _fill(self, oid, symbol, side, order_type, price, size):
+        base, quote = symbol.split('-')
+        sign = 1 if side == 'buy' else -1
+        self.balances[base] += sign*size
+        self.balances[quote] -= sign*size*price
+        self.messages.append({'type': 'message', 'topic': '/spotMarket/tradeOrders', 'subject': 'orderChange',
+                              'data': {'type': 'match', 'orderId': oid, 'symbol': symbol, 'side': side, 'orderType': order_type,
+                                       'matchPrice': str(price), 'matchSize': str(size), 'filledSize': str(size),
+                                       'tradeId': str(next(self.ids))}})
+        self._balance_changed(base)
+        self._balance_changed(quote)
+    def _balance_changed(self, currency):
+        self.messages.append({'type': 'message', 'topic': '/account/balance', 'subject': 'account.balance',
+                              'data': {'relationEvent': 'trade.setted', 'currency': currency, 'accountId': currency,
+                                       'total': str(self.balances[currency]), 'hold': str(self.holds[currency]),
+                                       'available': str(self.balances[currency] - self.holds[currency]),
+                                       'time': str(int(self.clock.time()*1000))}})
+
+
+class SoakTest:
+    """ Runs a Trader against a SyntheticExchange on a virtual clock, sampling resource use as it goes. """
+    def __init__(self, symbols, days: float, tick_interval: float = 10, sample_interval: float = 6*3600):
+        self.symbols = symbols
+        self.duration = days*24*3600
+        self.tick_interval = tick_interval
+        self.sample_interval = sample_interval
+        # [(simulated days, real seconds, rss, objects, worst lag, median lag), ...]
+        self.samples = []
+        self.lags = []
+
+    async def run(self):
+        import kutrader
+        kutrader.SYMBOLS = self.symbols
+        kutrader.HEADLESS = True
+        start = time.time() // 3600 * 3600
+        self.clock = VirtualClock(start)
+        self.exchange = SyntheticExchange(self.symbols, self.clock)
+        client = kutrader.KucoinClient(self.exchange, clock = self.clock)
+        trader = kutrader.Trader(client)
+        tasks = [asyncio.create_task(trader.main_loop()),
+                 asyncio.create_task(client.feed.scheduler.run()),
+                 asyncio.create_task(self.probe_lag())]
+        real_start = time.perf_counter()
+        next_sample = start
+        t = start
+        while t < start + self.duration:
+            t += self.tick_interval
+            await self.advance_to(t)
+            for sym in self.symbols:
+                await client.handle_evt(self.exchange.ticker(sym))
+            self.exchange.match_limit_orders()
+            while len(self.exchange.messages) > 0:
+                await client.handle_evt(self.exchange.messages.popleft())
+            if t >= next_sample:
+                self.sample(t - start, time.perf_counter() - real_start)
+                next_sample += self.sample_interval
+                for task in tasks:
+                    if task.done():
+                        # A task that died would make the rest of the run meaningless; raise its exception
+                        task.result()
+        trader.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    async def advance_to(self, t):
+        """ Moves the clock to t, letting every sleeper that is due run at its own time on the way. """
+        while True:
+            wake = self.clock.next_wake_time()
+            if wake is None or wake > t:
+                break
+            self.clock.advance_to(wake)
+            await asyncio.sleep(0)
+        self.clock.advance_to(t)
+        await asyncio.sleep(0)
+
+    async def probe_lag(self):
+        """ Measures, in real time, how late the event loop gets to a short sleep. """
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            self.lags.append(time.perf_counter() - before - 0.001)
+
+    def sample(self, simulated, real):
+        gc.collect()
+        lags = self.lags or [0]
+        self.samples.append((simulated/86400, real, rss_bytes(), len(gc.get_objects()), max(lags), statistics.median(lags)))
+        self.lags = []
+        day, real, rss, objects, worst, median = self.samples[-1]
+        print(f"{day:>8.2f}{real:>9.1f}{rss/2**20:>10.1f}{objects:>10}{worst*1000:>10.1f}{median*1000:>10.2f}", file = sys.__stdout__, flush = True)
+
+    def verdict(self, rss_tolerance: float = 0.1, object_tolerance: float = 0.05, lag_tolerance: float = 2):
+        """ Compares the second quarter of the run (after warming up) to the last quarter. Returns a list of failures. """
+        n = len(self.samples)
+        if n < 8:
+            return ["Too few samples for a verdict; run for longer."]
+        early = self.samples[n//4:n//2]
+        late = self.samples[-(n//4):]
+        def mean(samples, index):
+            return statistics.mean(s[index] for s in samples)
+        failures = []
+        rss_early, rss_late = mean(early, 2), mean(late, 2)
+        if rss_late > rss_early*(1 + rss_tolerance) + 5*2**20:
+            failures.append(f"Memory grew from {rss_early/2**20:.1f} MB to {rss_late/2**20:.1f} MB.")
+        objects_early, objects_late = mean(early, 3), mean(late, 3)
+        if objects_late > objects_early*(1 + object_tolerance) + 1000:
+            failures.append(f"Live objects grew from {objects_early:.0f} to {objects_late:.0f}.")
+        lag_early, lag_late = mean(early, 5), mean(late, 5)
+        if lag_late > lag_early*lag_tolerance + 0.005:
+            failures.append(f"Median loop lag grew from {lag_early*1000:.2f} ms to {lag_late*1000:.2f} ms.")
+        return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run the bot for weeks of simulated time and check that it doesn't grow.")
+    parser.add_argument('--weeks', type = float, default = 2)
+    parser.add_argument('--symbols', type = int, default = 10, help = "number of synthetic markets")
+    parser.add_argument('--tick', type = float, default = 10, help = "simulated seconds between ticker messages")
+    parser.add_argument('--sample', type = float, default = 6, help = "simulated hours between samples")
+    parser.add_argument('--workdir', default = None, help = "folder for the log files (default: a temporary folder)")
+    args = parser.parse_args()
+
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix = 'kutrader-soak-'))
+    print(f"Writing logs to {os.getcwd()}")
+    symbols = [f"SYN{i}-USDT" for i in range(args.symbols)]
+    test = SoakTest(symbols, args.weeks*7, tick_interval = args.tick, sample_interval = args.sample*3600)
+    print(f"{'day':>8}{'real s':>9}{'RSS MB':>10}{'objects':>10}{'max lag':>10}{'med lag':>10}")
+    # The bot prints its orders; keep them off the screen (a file, so they don't pile up in memory)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(test.run())
+    failures = test.verdict()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if len(failures) > 0:
+        sys.exit(1)
+    print("PASS")
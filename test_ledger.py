@@ -0,0 +1,66 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+# Checks of the FIFO lots of util.TradeStack and of saving and loading a ledger.py Ledger.
+# Usage: python -m pytest test_ledger.py
+
+import pytest
+
+from ledger import Ledger
+from util import Trade, TradeStack
+
+
+def test_sell_uses_oldest_lots_first():
+    position = TradeStack()
+    position.push(Trade('buy', 2, 10))
+    position.push(Trade('buy', 2, 20))
+    # Uses up the first lot and half of the second
+    position.push(Trade('sell', 3, 30))
+    assert position.realized_pnl == pytest.approx(2*(30 - 10) + 1*(30 - 20))
+    assert position.quantity == pytest.approx(1)
+    assert [list(lot) for lot in position.lots] == [[pytest.approx(1), 20]]
+    assert position.get_average_cost() == pytest.approx(20)
+    assert position.get_unrealized_pnl(25) == pytest.approx(5)
+    assert position.untracked == 0
+
+def test_selling_more_than_held_is_untracked():
+    position = TradeStack()
+    position.push(Trade('buy', 1, 10))
+    position.push(Trade('sell', 1.5, 12))
+    assert position.realized_pnl == pytest.approx(2)
+    assert position.untracked == pytest.approx(0.5)
+    assert position.quantity == 0
+    assert position.cost_basis == 0
+    assert position.get_average_cost() is None
+
+def test_duplicate_fills_are_counted_once():
+    ledger = Ledger()
+    assert ledger.record_fill('BTC-USDT', 'buy', 1, 100, trade_id = 'a')
+    assert not ledger.record_fill('BTC-USDT', 'buy', 1, 100, trade_id = 'a')
+    assert ledger.positions['BTC-USDT'].quantity == 1
+
+def test_every_fill_is_saved_and_loaded(tmp_path):
+    path = str(tmp_path/'ledger-main.json')
+    ledger = Ledger(path)
+    ledger.record_fill('BTC-USDT', 'buy', 2, 100, trade_id = 'a')
+    ledger.record_fill('BTC-USDT', 'buy', 1, 110, trade_id = 'b')
+    ledger.record_fill('BTC-USDT', 'sell', 2.5, 120, trade_id = 'c')
+    ledger.record_fill('ETH-USDT', 'sell', 1, 50, trade_id = 'd')
+    # No close(): a crash right after the last fill loses nothing
+    loaded = Ledger(path)
+    assert loaded.to_dict() == ledger.to_dict()
+    btc = loaded.positions['BTC-USDT']
+    assert btc.quantity == pytest.approx(0.5)
+    assert btc.get_average_cost() == pytest.approx(110)
+    assert btc.realized_pnl == pytest.approx(2*20 + 0.5*10)
+    assert loaded.positions['ETH-USDT'].untracked == 1
+    # The trade ids came back too, so a fill delivered again after the restart is still only counted once
+    assert not loaded.record_fill('BTC-USDT', 'sell', 0.5, 120, trade_id = 'c')
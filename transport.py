@@ -0,0 +1,181 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" A fast path for placing and cancelling orders.
+
+OrderTransport sends the order requests of one account over a single kept-alive HTTPS connection, signs them with
+key material prepared once, and stamps them with the server's clock rather than the local one. It has the same order
+methods as the kucoin Client, except that they are coroutines, and keeps the round trip time of every request.
+Requests are sent from a thread of their own, so the event loop carries on while they are out; a requests Session
+may only be used by one thread at a time, so it is always the same thread.
+"""
+
+import asyncio
+import base64
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import statistics
+import time
+from urllib.parse import urlencode
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from kucoin.exceptions import KucoinAPIException
+
+from clock import SYSTEM_CLOCK
+
+API_URL = 'https://api.kucoin.com'
+SANDBOX_API_URL = 'https://openapi-sandbox.kucoin.com'
+
+# Number of recent round trip times kept for each kind of request
+LATENCY_HISTORY = 100
+
+
+class OrderTransport:
+    """ Places and cancels the orders of one account. """
+    def __init__(self, api_key: str, api_secret: str, passphrase: str, sandbox: bool = False, timeout: float = 10,
+                 clock = SYSTEM_CLOCK):
+        self.url = SANDBOX_API_URL if sandbox else API_URL
+        self.timeout = timeout
+        self.clock = clock
+        # Each request signs with a copy of this, so the key is only processed once
+        self.hmac = hmac.new(api_secret.encode('utf-8'), digestmod = hashlib.sha256)
+        # Version 2 keys send the passphrase signed with the secret, which never changes
+        signed_passphrase = self._sign(passphrase)
+        self.session = requests.Session()
+        # The only thread that uses self.session
+        self.executor = ThreadPoolExecutor(1, "OrderTransport")
+        # One account sends one request at a time, so one connection is enough; keep it open between orders
+        self.session.mount('https://', HTTPAdapter(pool_connections = 1, pool_maxsize = 1))
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'KC-API-KEY': api_key,
+            'KC-API-PASSPHRASE': signed_passphrase,
+            'KC-API-KEY-VERSION': '2',
+        })
+        # Milliseconds to add to the local clock to get the server's
+        self.time_offset = 0
+        # { 'METHOD /path' : deque of seconds }
+        self.latencies = defaultdict(lambda: deque(maxlen = LATENCY_HISTORY))
+        self.closed = False
+
+    def _sign(self, message: str):
+        signer = self.hmac.copy()
+        signer.update(message.encode('utf-8'))
+        return base64.b64encode(signer.digest()).decode('utf-8')
+
+    def server_time(self):
+        """ The server's time in milliseconds, as estimated from the local clock. """
+        return int(self.clock.time()*1000) + self.time_offset
+
+    async def _send(self, *args, **kwargs):
+        """ Sends a request from the transport's thread (see _request()), and returns the data of the response. """
+        request = functools.partial(self._request, *args, **kwargs)
+        return await asyncio.get_event_loop().run_in_executor(self.executor, request)
+    def _request(self, method: str, path: str, params: dict = None, signed: bool = True, name: str = None):
+        """ Sends a request and returns the data of the response, like the kucoin Client. Only call this from
+        self.executor. Its round trip time is kept under name, by default the method and path. """
+        name = name or f"{method} {path}"
+        body = ''
+        if method == 'GET' or method == 'DELETE':
+            if params:
+                path = f"{path}?{urlencode(params)}"
+        elif params:
+            body = json.dumps(params, separators = (',', ':'))
+        headers = None
+        if signed:
+            timestamp = str(self.server_time())
+            headers = {
+                'KC-API-TIMESTAMP': timestamp,
+                'KC-API-SIGN': self._sign(timestamp + method + path + body),
+            }
+        start = time.perf_counter()
+        response = self.session.request(method, self.url + path, data = body or None, headers = headers, timeout = self.timeout)
+        self.latencies[name].append(time.perf_counter() - start)
+        if not str(response.status_code).startswith('2'):
+            raise KucoinAPIException(response)
+        try:
+            result = response.json()
+        except ValueError:
+            raise KucoinAPIException(response)
+        if result.get('code') != '200000':
+            raise KucoinAPIException(response)
+        return result.get('data')
+
+    async def sync_time(self):
+        """ Measures the offset of the local clock from the server's, taking the server's time to be that of the middle
+        of the round trip. Returns the offset in milliseconds. """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, self._sync_time)
+    def _sync_time(self):
+        before = self.clock.time()
+        server = self._request('GET', '/api/v1/timestamp', signed = False)
+        after = self.clock.time()
+        self.time_offset = int(server - (before + after)/2*1000)
+        return self.time_offset
+    async def keep_time(self, interval: float = 60):
+        """ Measures the clock offset every interval seconds until close() is called. The requests also keep the
+        connection from going idle between orders. """
+        while not self.closed:
+            try:
+                await self.sync_time()
+            except Exception as e:
+                logging.info(f" Could not get the server time: {e!r}")
+            await self.clock.sleep(interval)
+    def close(self):
+        self.closed = True
+        self.executor.submit(self.session.close)
+        self.executor.shutdown(wait = False)
+
+    def latency_summary(self):
+        """ Returns { 'METHOD /path' : { 'count', 'last', 'median', 'max' } } of the recent round trip times in seconds. """
+        return {request: {'count': len(times), 'last': times[-1], 'median': statistics.median(times), 'max': max(times)}
+                for request, times in self.latencies.items() if len(times) > 0}
+
+    async def create_market_order(self, symbol, side, size = None, funds = None, client_oid = None, remark = None, stp = None):
+        if not size and not funds:
+            raise ValueError('Need size or fund parameter')
+        if size and funds:
+            raise ValueError('Need size or fund parameter not both')
+        data = {'side': side, 'symbol': symbol, 'type': 'market', 'clientOid': client_oid or str(uuid.uuid4())}
+        if size:
+            data['size'] = size
+        if funds:
+            data['funds'] = funds
+        if remark:
+            data['remark'] = remark
+        if stp:
+            data['stp'] = stp
+        return await self._send('POST', '/api/v1/orders', data)
+    async def create_limit_order(self, symbol, side, price, size, client_oid = None, remark = None, time_in_force = None,
+                                 stp = None, cancel_after = None, post_only = None, hidden = None, iceberg = None,
+                                 visible_size = None):
+        data = {'symbol': symbol, 'side': side, 'type': 'limit', 'price': price, 'size': size,
+                'clientOid': client_oid or str(uuid.uuid4())}
+        optional = {'remark': remark, 'timeInForce': time_in_force, 'stp': stp, 'cancelAfter': cancel_after,
+                    'postOnly': post_only, 'hidden': hidden, 'iceberg': iceberg, 'visibleSize': visible_size}
+        data.update({key: value for key, value in optional.items() if value is not None})
+        return await self._send('POST', '/api/v1/orders', data)
+    async def cancel_order(self, order_id):
+        return await self._send('DELETE', f'/api/v1/orders/{order_id}', name = 'DELETE /api/v1/orders/{orderId}')
+    async def cancel_all_orders(self, symbol = None):
+        return await self._send('DELETE', '/api/v1/orders', {'symbol': symbol} if symbol else None)
+    async def get_orders(self, symbol = None, status = None, side = None, order_type = None, start = None, end = None,
+                         page = None, limit = None):
+        params = {'symbol': symbol, 'status': status, 'side': side, 'type': order_type, 'startAt': start, 'endAt': end,
+                  'currentPage': page, 'pageSize': limit}
+        return await self._send('GET', '/api/v1/orders', {key: value for key, value in params.items() if value is not None})
@@ -10,10 +10,17 @@
 # OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
 
 import asyncio
-from collections import defaultdict, deque
-import time
+from collections import deque
+import itertools
 from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import indicators
+from clock import SYSTEM_CLOCK
 # Constants
+# Quantities smaller than this are treated as zero
+DUST = 1e-12
 window_to_sec = {
     '1min': 60,
     '3min': 3*60, 
@@ -32,43 +39,16 @@ window_to_sec = {
 
 # Useful functions
 def RSI(prices, period, current_only=False):
-    """ Calculate RSI and return the values as a pandas DataFrame.
+    """ Calculate RSI and return the values as a numpy array (see indicators.rsi).
     
-    prices -- should be a pandas DataFrame containing price info
+    prices -- a sequence of prices, oldest first (a list, numpy array or pandas Series)
     current_only -- set this to True to just return the most recent value of the RSI
     """
-    
-    # Get the price changes
-    delta = prices.diff()
-    
-    # Get rid of the first entry, which is NaN
-    delta = delta[1:] 
-    
-    up, down = delta.copy(), delta.copy()
-    # List of only upward moves (replace downward moves with 0)
-    up[up < 0] = 0
-    # List of only downward moves (replace upward moves with 0)
-    down[down > 0] = 0
-    
-    # Calculate EMA of upward and downward moves
-    roll_up1 = up.ewm(span=period).mean()
-    roll_down1 = down.abs().ewm(span=period).mean()
-    
-    # Relative Strength
-    try:
-        rs = roll_up1 / roll_down1
-    except ZeroDivisionError:
-        # RSI is 100 if all up moves...
-        rs = float("Inf")
-    # Finally...
-    rsi = 100.0 - (100.0 / (1.0 + rs))
-    
     if current_only:
-        # Just return most recent RSI value
-        # print(rsi)
-        return rsi.iloc[-1]
+        # Only looks at the prices that can still affect the most recent value
+        return indicators.rsi_last(prices, period)
     # Returns a list of RSI values
-    return rsi
+    return indicators.rsi(prices, period)
 def float_to_ndigits(f):
     """ Returns the number of digits after the decimal point """
     if f == int(f): return 0
@@ -82,9 +62,13 @@ def approx_equal(f1, f2, tolerance=0.001):
         return True
 
 
+# Reused by every call to ainput, rather than starting a thread per prompt
+_input_executor = None
 async def ainput(prompt: str = "") -> str:
-    with ThreadPoolExecutor(1, "AsyncInput") as executor:
-        return await asyncio.get_event_loop().run_in_executor(executor, input, prompt)
+    global _input_executor
+    if _input_executor is None:
+        _input_executor = ThreadPoolExecutor(1, "AsyncInput")
+    return await asyncio.get_event_loop().run_in_executor(_input_executor, input, prompt)
 
 class Capturing(list):
     """Capture stdout and save it as a variable. Usage:
@@ -110,6 +94,18 @@ class smartdict(dict):
         else:
             return self.defaults[key]
 
+def lookup_setting(overrides: dict, key: str, symbol: str, defaults: dict):
+    """ The value of a setting for symbol: overrides[key] if given, else defaults[key]. Either may be a single value,
+    or a dict by symbol (such as the defaultdicts of config.py). """
+    value = overrides.get(key)
+    if isinstance(value, dict):
+        value = value.get(symbol)
+    if value is None:
+        value = defaults[key]
+        if isinstance(value, dict):
+            value = value[symbol]
+    return value
+
 def pad_or_trim(f: float, max_size = 7):
     try:
         f = float(f)
@@ -123,10 +119,12 @@ def pad_or_trim(f: float, max_size = 7):
     # return final_str
 class MarketData:
     # Adapted for KuCoin kline data
-    def __init__(self, client, symbol: str, candle_period: str, moving_averages = (20, 50), update_on_create = True):
+    def __init__(self, client, symbol: str, candle_period: str, moving_averages = (20, 50), update_on_create = True, clock = SYSTEM_CLOCK,
+                 min_history: int = 0):
         # internal data = [ [time, open, close, high, low, amount, volume, [sma1, sma2], [ema1, ema2]], ... ]
         # data is ordered with latest time first
-        self.max_history = 4*max(moving_averages)
+        # At least min_history candles are kept, for others who compute their own indicators from them
+        self.max_history = max(4*max(moving_averages), min_history)
         self.data = deque()
 
         self.ma_periods = moving_averages
@@ -135,16 +133,46 @@ class MarketData:
         self.window_seconds = window_to_sec[candle_period]
         
         self.client = client
+        self.clock = clock
+        # Number of REST requests made, so callers can keep to a rate limit
+        self.requests_made = 0
         if update_on_create: self.update()
-        self.auto_updating = False
         # Store the last time that a crossover was detected (i.e. get_ma_crossover() was called with a positive result)
         self.last_cross_time = {'SMA': 0, 'EMA': 0}
-    def stop(self):
-        self.auto_updating = False
-    def get_ma_crossover(self, ma='SMA'):
+
+        # The candle still forming, [time, open, close, high, low], as updated by on_tick()
+        self.live = None
+        # Provisional (fast, slow) moving averages of the forming candle
+        self.live_ma = {'SMA': None, 'EMA': None}
+        # The crossover the forming candle is heading for, as [direction, since, ticks]
+        self.pending = {'SMA': None, 'EMA': None}
+        # (candle time, direction) of the last crossover get_live_crossover() reported
+        self.live_signal = None
+        # Ticks, seconds and percent of the price apart a pending crossover needs (see set_live_confirmation())
+        self.live_confirmation = (1, 0, 0)
+        # What the provisional averages need from the closed candles, computed once per candle (see _live_base())
+        self._live_cache = None
+    def set_ma_periods(self, moving_averages, min_history: int = 0):
+        """ Changes the moving average periods (and the minimum number of candles kept). The averages are recomputed
+        from the candles already held, unless more history is needed, in which case the candles are downloaded again. """
+        moving_averages = tuple(moving_averages)
+        max_history = max(4*max(moving_averages), min_history)
+        if moving_averages == tuple(self.ma_periods) and max_history == self.max_history:
+            return
+        frames = [frame[:7] for frame in self.data]
+        self.ma_periods = moving_averages
+        self.data = deque()
+        self._live_cache = None
+        if max_history > self.max_history:
+            self.max_history = max_history
+            self.update()
+        else:
+            self.max_history = max_history
+            self._feed_data(frames)
+    def get_ma_crossover(self, ma='SMA', mark=True):
         """ Returns 'bullish', 'bearish' or None depending on the moving average crossover.
          If the return value is not None, it returns a second value of True or False depending if this is the 
-        first time this result has been polled on this candle. """
+        first time this result has been polled on this candle. Set mark to False to peek without counting as a poll. """
         ma = ma.upper()
         assert(ma in {'SMA', 'EMA'})
         ma_idx = 7
@@ -168,10 +196,97 @@ class MarketData:
         if retval is not None:
             if self.last_cross_time[ma] != self._last_time():
                 first_occur = True
-                self.last_cross_time[ma] = self._last_time()
+                if mark: self.last_cross_time[ma] = self._last_time()
             else: first_occur = False
         return retval, first_occur
 
+    def set_live_confirmation(self, ticks: int = 1, seconds: float = 0, separation: float = 0):
+        """ Sets what a pending crossover needs before get_live_crossover() reports it: to have held for ticks tickers
+        in a row and for seconds, with the fast and slow averages at least separation percent of the price apart. """
+        self.live_confirmation = (ticks, seconds, separation)
+    def on_tick(self, price: float, now: float = None):
+        """ Updates the forming candle with the latest price, and the provisional moving averages and pending
+        crossovers it gives. Takes constant time; nothing is recomputed from the history. """
+        now = self.clock.time() if now is None else now
+        last = self._last_time()
+        start = None if last is None else last + self.window_seconds
+        if start is None or not start <= now < start + self.window_seconds:
+            # The candles before this one haven't been downloaded yet, so there is nothing to build on
+            self.live = None
+            self.live_ma = {'SMA': None, 'EMA': None}
+            self.pending = {'SMA': None, 'EMA': None}
+            return
+        if self.live is None or self.live[0] != start:
+            self.live = [start, price, price, price, price]
+            self.pending = {'SMA': None, 'EMA': None}
+        else:
+            self.live[2] = price
+            self.live[3] = max(self.live[3], price)
+            self.live[4] = min(self.live[4], price)
+        sums, prev_emas = self._live_base()
+        self.live_ma['SMA'] = tuple(None if s is None else (s + price)/period for s, period in zip(sums, self.ma_periods))
+        self.live_ma['EMA'] = tuple(None if e is None else price*2/(1 + period) + e*(1 - 2/(1 + period))
+                                    for e, period in zip(prev_emas, self.ma_periods))
+        for ma, ma_idx in (('SMA', 7), ('EMA', 8)):
+            direction = None
+            this_fast, this_slow = self.live_ma[ma][:2]
+            # The oldest candle has no averages
+            last_fast, last_slow = self.data[0][ma_idx][:2] if len(self.data[0]) > ma_idx else (None, None)
+            if None in (this_fast, this_slow, last_fast, last_slow):
+                pass
+            elif last_fast <= last_slow and this_fast > this_slow:
+                direction = 'bullish'
+            elif last_fast >= last_slow and this_fast < this_slow:
+                direction = 'bearish'
+            pending = self.pending[ma]
+            if direction is None:
+                self.pending[ma] = None
+            elif pending is None or pending[0] != direction:
+                self.pending[ma] = [direction, now, 1]
+            else:
+                pending[2] += 1
+    def _live_base(self):
+        """ Returns (sums, emas): for each MA period N, the sum of the latest N - 1 closes, and the EMA of the latest
+        candle (or its SMA, which seeds the EMA). None where there is too little history. """
+        last = self._last_time()
+        if self._live_cache is None or self._live_cache[0] != last:
+            closes = [float(frame[2]) for frame in itertools.islice(self.data, max(self.ma_periods) - 1)]
+            sums = [sum(closes[:period - 1]) if len(closes) >= period - 1 else None for period in self.ma_periods]
+            latest = self.data[0]
+            emas = [None]*len(self.ma_periods)
+            if len(latest) > 8:
+                emas = [e if e is not None else s for e, s in zip(latest[8], latest[7])]
+            self._live_cache = (last, sums, emas)
+        return self._live_cache[1], self._live_cache[2]
+    def get_pending_crossover(self, ma='SMA'):
+        """ Returns the crossover the forming candle is heading for ('bullish' or 'bearish'), confirmed or not, or None. """
+        pending = self.pending[ma.upper()]
+        if pending is None or self.live is None or self.live[0] != (self._last_time() or 0) + self.window_seconds:
+            return None
+        return pending[0]
+    def get_live_crossover(self, ma='SMA', mark=True, now=None):
+        """ Returns the crossover the forming candle is heading for, once it meets the rules of set_live_confirmation(),
+        otherwise None. Like get_ma_crossover(), a second value tells if this is the first time it was polled on this
+        candle. Set mark to False to peek without counting as a poll. """
+        ma = ma.upper()
+        assert(ma in {'SMA', 'EMA'})
+        direction = self.get_pending_crossover(ma)
+        if direction is None:
+            return None, None
+        now = self.clock.time() if now is None else now
+        ticks, seconds, separation = self.live_confirmation
+        _, since, held = self.pending[ma]
+        fast, slow = self.live_ma[ma][:2]
+        if held < ticks or now - since < seconds or abs(fast - slow) < separation/100*self.live[2]:
+            return None, None
+        signal = (self.live[0], direction)
+        first_occur = self.live_signal != signal
+        if mark: self.live_signal = signal
+        return direction, first_occur
+
+    def get_closes(self):
+        """ Returns the closing prices as a numpy array, oldest first, for use with the indicators module. """
+        return np.array([float(frame[2]) for frame in reversed(self.data)])
     def get_last_close(self):
         if len(self.data) > 0:
             return self.data[0][2]
@@ -186,18 +301,18 @@ class MarketData:
             return self.data[0][ma_idx]
         except IndexError:
             return [None]*len(self.ma_periods)
-    async def auto_update(self, wait=True):
-        self.auto_updating = True
-        if not wait:
-            self.update()
-        while self.auto_updating:
-            await asyncio.sleep( self.window_seconds*0.75 )
-            self.update()
-    def update(self):
+    def needs_update(self, now = None):
+        """ Returns True if a candle has closed since the latest one in self.data. """
+        return self._closed_frames_missing(self.clock.time() if now is None else now) >= 1
+    def _closed_frames_missing(self, now):
         if self._last_time() is None:
-            new_frames = self.max_history
-        else:
-            new_frames = (time.time() - self._last_time()) // self.window_seconds
+            return self.max_history
+        # The candle after the latest one closes a full window after it opens
+        return (now - self._last_time()) // self.window_seconds - 1
+    def update(self):
+        """ Downloads the candles that have closed since the last update. Candles that are still open are left out,
+        so the moving averages only ever use final closing prices. """
+        new_frames = self._closed_frames_missing(self.clock.time())
         if new_frames >= 1:
             new_frames = min(self.max_history, new_frames)
             data = self._get_kline_data(new_frames)
@@ -208,21 +323,26 @@ class MarketData:
         self.data.reverse()
     def _get_kline_data(self, candle_quantity: int):
         candle_quantity = int(candle_quantity)
-        now = int(time.time())
-        start = now - candle_quantity*self.window_seconds
+        now = int(self.clock.time())
+        # One extra candle, since the latest one is usually still open
+        start = now - (candle_quantity + 1)*self.window_seconds
         # print(f"data = self.client.get_kline_data({self.symbol}, kline_type = {self.candle_period}, start = {start})")
-        data = self.client.get_kline_data(self.symbol, kline_type = self.candle_period, start = start)
+        data = self._closed_only(self.client.get_kline_data(self.symbol, kline_type = self.candle_period, start = start), now)
+        self.requests_made += 1
 
         if len(data) < candle_quantity:
             try:
-                now = int(data[0][0])
-                start = now - candle_quantity*self.window_seconds
+                latest = int(data[0][0])
+                start = latest - candle_quantity*self.window_seconds
             except IndexError:
                 start = None
             finally:
-                data = self.client.get_kline_data(self.symbol, kline_type = self.candle_period, start = start)
+                data = self._closed_only(self.client.get_kline_data(self.symbol, kline_type = self.candle_period, start = start), now)
+                self.requests_made += 1
         # assert(len(data) >= candle_quantity)
         return data[:candle_quantity]
+    def _closed_only(self, data, now):
+        return [frame for frame in data if int(frame[0]) + self.window_seconds <= now]
 
     def _last_time(self):
         """ returns the timestamp of the latest frame in self.data """
@@ -293,19 +413,52 @@ class Trade:
         self.cost_basis = quantity * price
         if side == 'sell': self.cost_basis = -1*self.cost_basis
 class TradeStack:
+    """ A position built up from trades, as lots that are sold first in, first out.
+    Each buy adds a lot. Each sell uses up the oldest lots first, realizing the difference between the sale price and
+    their cost. Both take amortized constant time. """
     def __init__(self, quantity = 0, cost_basis = 0):
-        self.quantity = quantity
-        self.cost_basis = cost_basis
+        # [ [quantity, price], ... ], oldest first
+        self.lots = deque()
+        self.quantity = 0
+        # Cost of the lots still held
+        self.cost_basis = 0
+        self.realized_pnl = 0
+        # Quantity sold beyond the lots held (e.g. bought before the position was tracked), whose cost is unknown
+        self.untracked = 0
+        if quantity > 0:
+            self.push(Trade('buy', quantity, cost_basis/quantity))
     def push(self, trade: Trade):
         if trade.side == 'buy':
-            q = self.quantity + trade.quantity
+            self.lots.append([trade.quantity, trade.price])
+            self.quantity += trade.quantity
+            self.cost_basis += trade.quantity*trade.price
         elif trade.side == 'sell':
-            q = self.quantity - trade.quantity
-        self.cost_basis += trade.cost_basis
-        assert(q >= 0)
-        self.quantity = q
+            remaining = trade.quantity
+            while remaining > 0 and len(self.lots) > 0:
+                lot = self.lots[0]
+                used = min(remaining, lot[0])
+                self.realized_pnl += used*(trade.price - lot[1])
+                self.quantity -= used
+                self.cost_basis -= used*lot[1]
+                lot[0] -= used
+                remaining -= used
+                if lot[0] <= DUST:
+                    self.lots.popleft()
+            if remaining > DUST:
+                self.untracked += remaining
+            if len(self.lots) == 0:
+                # Don't let rounding errors pile up
+                self.quantity = 0
+                self.cost_basis = 0
+    def get_average_cost(self):
+        if self.quantity <= 0: return None
+        return self.cost_basis/self.quantity
+    def get_unrealized_pnl(self, current_price):
+        return self.quantity*current_price - self.cost_basis
     def get_pnl(self, current_price, as_percent = False):
-        value = self.quantity*current_price
-        profit = value - self.cost_basis
-        if as_percent: return (profit / self.cost_basis)*100
-        else: return profit
\ No newline at end of file
+        """ Realized plus unrealized profit. As a percentage, it is relative to the cost of the lots held. """
+        profit = self.get_unrealized_pnl(current_price) + self.realized_pnl
+        if as_percent:
+            if self.cost_basis == 0: return None
+            return (profit / self.cost_basis)*100
+        else: return profit
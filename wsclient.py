@@ -0,0 +1,142 @@
+# Copyright 2021 Micah Loverro
+# Loverro Software Consulting
+# Permission is hereby granted, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to use or copy this software. Permission is not granted to publish, distribute, sublicense, and/or sell copies of the Software.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHOR OR COPYRIGHT HOLDER BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE. THE AUTHOR OR COPYRIGHT HOLDERS SHALL NOT BE RESPONSIBLE FOR ANY LOSS
+# OF PROPERTY OR ASSETS FROM USING THIS SOFTWARE.
+
+""" Websocket client for KuCoin.
+
+KucoinWebsocket gets a token and server from the REST API, connects, answers the server's keepalive with pings, and
+reconnects (renewing the token and subscriptions) whenever the connection drops. Each message is decoded once and
+passed straight to the handler registered for its topic by subscribe(). Handlers are plain functions, called with
+the decoded message. See bench_messages.py for the cost of decoding and dispatching a message.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+
+import websockets
+
+from clock import SYSTEM_CLOCK
+
+# orjson decodes several times faster than json, but isn't required
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+# Longest wait between attempts to reconnect, in seconds
+MAX_RECONNECT_DELAY = 60
+
+
+class KucoinWebsocket:
+    """ One websocket connection, to the public or (if private) the private channels of client's account.
+    If record is given, it is called with the text of every message passed to a handler, before it is handled. """
+    def __init__(self, client, private: bool = False, record = None, clock = SYSTEM_CLOCK, timeout: float = 10):
+        self.client = client
+        self.private = private
+        self.record = record
+        self.clock = clock
+        self.timeout = timeout
+        # { topic : handler }
+        self.handlers = dict()
+        self.ws = None
+        self.ids = itertools.count()
+        self.last_received = 0
+        # Seconds to wait before the next attempt to connect; doubles with every failure in a row
+        self.reconnect_delay = 1
+        self.closed = False
+
+    async def subscribe(self, topic: str, handler):
+        """ Calls handler(msg) for every message of topic from now on, including after reconnecting. """
+        self.handlers[topic] = handler
+        if self.ws is not None:
+            await self._send('subscribe', topic)
+    async def unsubscribe(self, topic: str):
+        self.handlers.pop(topic, None)
+        if self.ws is not None:
+            await self._send('unsubscribe', topic)
+    async def _send(self, kind: str, topic: str):
+        await self.ws.send(json.dumps({'id': str(next(self.ids)), 'type': kind, 'topic': topic,
+                                       'privateChannel': self.private, 'response': True}))
+
+    def dispatch(self, raw):
+        """ Decodes a message and passes it to the handler of its topic. Replies to pings, subscriptions etc. have no
+        topic, so they are dropped here unless they report an error. """
+        msg = loads(raw)
+        handler = self.handlers.get(msg.get('topic'))
+        if handler is None:
+            if msg.get('type') == 'error':
+                logging.info(f" Websocket error: {msg}")
+            return
+        if self.record is not None:
+            self.record(raw)
+        try:
+            handler(msg)
+        except Exception:
+            # One bad message shouldn't take down the connection
+            logging.exception(f" Error handling websocket message: {msg}")
+
+    async def run(self):
+        """ Keeps the connection up, until close() is called. """
+        while not self.closed:
+            try:
+                await self._connect()
+            except Exception as e:
+                if self.closed:
+                    break
+                logging.info(f" Websocket {'private' if self.private else 'public'} connection failed: {e!r}")
+            if self.closed:
+                break
+            await self.clock.sleep(self.reconnect_delay)
+            self.reconnect_delay = min(2*self.reconnect_delay, MAX_RECONNECT_DELAY)
+    async def _connect(self):
+        """ Connects and handles messages until the connection closes. """
+        details = self.client.get_ws_endpoint(private = self.private)
+        server = details['instanceServers'][0]
+        url = f"{server['endpoint']}?token={details['token']}&connectId={uuid.uuid4()}"
+        # KuCoin has its own keepalive, so the library's pings are turned off
+        async with websockets.connect(url, ping_interval = None, open_timeout = self.timeout) as ws:
+            welcome = loads(await asyncio.wait_for(ws.recv(), self.timeout))
+            if welcome.get('type') != 'welcome':
+                raise ConnectionError(f"Expected a welcome message, got {welcome}")
+            self.ws = ws
+            self.last_received = self.clock.time()
+            # Connected, so however this connection ends, the next attempt starts without a long wait
+            self.reconnect_delay = 1
+            pinger = asyncio.create_task(self._keepalive(server['pingInterval']/1000, server['pingTimeout']/1000))
+            try:
+                for topic in list(self.handlers):
+                    await self._send('subscribe', topic)
+                async for raw in ws:
+                    self.last_received = self.clock.time()
+                    self.dispatch(raw)
+            finally:
+                self.ws = None
+                pinger.cancel()
+    async def _keepalive(self, interval: float, timeout: float):
+        """ Pings every interval seconds, and drops the connection if nothing has arrived for longer than interval
+        plus timeout, so that run() reconnects. """
+        while self.ws is not None:
+            await self.clock.sleep(interval)
+            ws = self.ws
+            if ws is None:
+                return
+            if self.clock.time() - self.last_received > interval + timeout:
+                logging.info(" Websocket went quiet, reconnecting.")
+                await ws.close()
+                return
+            await ws.send(json.dumps({'id': str(next(self.ids)), 'type': 'ping'}))
+
+    def close(self):
+        self.closed = True
+        if self.ws is not None:
+            asyncio.ensure_future(self.ws.close())